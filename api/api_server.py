@@ -1,23 +1,55 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 from pydantic import BaseModel
-from typing import Dict, List
+from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
 import secrets
+import base64
+from datetime import datetime
 import asyncio
-from modules.graph_module import KnowledgeGraph
+import time
+import json
+import logging
+from modules.graph_module import KnowledgeGraph, similarity_backend
 from modules.llm_module import LLMJudger
-from modules.emotion_module import update_emotion, update_mood
+from modules.emotion_module import update_emotion, update_mood, get_sentiment_analyzer
 from modules.config_module import Config
+from modules.context_module import ContextBuilder
+from modules.batch_module import iter_batch
+from modules.rejudge_module import RejudgeJob
+from modules.shard_module import ShardManager
+from modules.visualization_module import GraphRenderer, RenderJobs
+from modules.analytics_module import GRANULARITIES
+from modules.profiling_module import RequestProfiler
+from modules.metrics_module import (REGISTRY, REQUEST_LATENCY, BACKGROUND_FAILURES, BACKGROUND_BACKLOG,
+                                    GRAPH_NODES, SHARDS_LOADED)
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build LLM providers at startup instead of import time, optionally warming up models."""
+    get_llm()
+    if config.warmup:
+        await asyncio.to_thread(warm_up)
+    maintenance = asyncio.create_task(evict_idle_shards(), name='shard_maintenance')
+    yield
+    maintenance.cancel()
+    shards.save_all()
+
 
 app = FastAPI(
     title="RegretGraph API",
     description="Self-refining cognitive memory system via regret-based pruning",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -35,16 +67,62 @@ app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 app.add_middleware(SlowAPIMiddleware)
 
+
+# Per-route request latency
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get('route')
+    REQUEST_LATENCY.observe(time.perf_counter() - start, method=request.method,
+                            route=getattr(route, 'path', 'unmatched'), status=str(response.status_code))
+    return response
+
+
+# Opt-in profiling of sampled requests, or of admin requests asking for it with X-Profile: 1
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    # Forced traces bypass the slow threshold, so anonymous clients must not be able to flood the ring buffer
+    requested = request.headers.get('X-Profile') == '1' and is_admin(request)
+    profile = profiler.start(requested)
+    if profile is None:
+        return await call_next(request)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        trace = profiler.finish(profile, request.method, request.url.path, time.perf_counter() - start, requested)
+    if trace is not None:
+        response.headers['X-Profile-Id'] = str(trace.trace_id)
+    return response
+
+
 # Basic auth
 security = HTTPBasic()
 USERNAME = "admin"
 PASSWORD = "secret"  # Change this in production
 
 
+def check_credentials(username: str, password: str) -> bool:
+    correct_username = secrets.compare_digest(username, USERNAME)
+    correct_password = secrets.compare_digest(password, PASSWORD)
+    return correct_username and correct_password
+
+
+def is_admin(request: Request) -> bool:
+    """Whether the request carries valid basic-auth credentials, for use outside route dependencies."""
+    scheme, _, encoded = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'basic':
+        return False
+    try:
+        username, _, password = base64.b64decode(encoded).decode('utf-8').partition(':')
+    except (ValueError, UnicodeDecodeError):
+        return False
+    return check_credentials(username, password)
+
+
 def verify_credentials(credentials: HTTPBasicCredentials = Depends(security)):
-    correct_username = secrets.compare_digest(credentials.username, USERNAME)
-    correct_password = secrets.compare_digest(credentials.password, PASSWORD)
-    if not (correct_username and correct_password):
+    if not check_credentials(credentials.username, credentials.password):
         raise HTTPException(
             status_code=401,
             detail="Incorrect username or password",
@@ -56,6 +134,13 @@ def verify_credentials(credentials: HTTPBasicCredentials = Depends(security)):
 # Pydantic models
 class PromptRequest(BaseModel):
     prompt: str
+    session_id: Optional[str] = None  # Session or tenant graph shard; omitted = global graph
+
+
+class BatchPromptRequest(BaseModel):
+    prompts: List[str]
+    concurrency: Optional[int] = None
+    session_id: Optional[str] = None
 
 
 class PromptResponse(BaseModel):
@@ -76,6 +161,19 @@ class ForgetResponse(BaseModel):
 class FeedbackRequest(BaseModel):
     node_id: int
     rating: int  # 1-10, where 1 is very bad, 10 is excellent
+    session_id: Optional[str] = None
+
+
+class RejudgeRequest(BaseModel):
+    chunk_size: Optional[int] = None
+    concurrency: Optional[int] = None
+
+
+class RenderRequest(BaseModel):
+    view: str = "nodes"  # nodes, cluster, time or regret
+    time_bucket: str = "day"  # hour, day or month (time view)
+    max_nodes: Optional[int] = None
+    session_id: Optional[str] = None
 
 
 class HealthResponse(BaseModel):
@@ -85,13 +183,82 @@ class HealthResponse(BaseModel):
 
 # Initialize components
 config = Config()
-graph = KnowledgeGraph()
-llm_provider = config.create_llm_provider()
-judge_provider = config.create_judge_provider()
-llm = LLMJudger(llm_provider, judge_provider)
+graph = config.create_graph()
+llm: Optional[LLMJudger] = None  # Built by get_llm() on startup or first use
+context_builder = ContextBuilder(config.context_token_budget, config.context_snippet_chars)
 regret_threshold = config.regret_threshold
 forgetting_decay = config.forgetting_decay
 mood_threshold = config.mood_threshold
+profiler = RequestProfiler(config.profiling_enabled, config.profiling_sample_rate,
+                           config.profiling_slow_threshold_ms, config.profiling_ring_size)
+rejudge_job: Optional[RejudgeJob] = None
+background_tasks = set()
+shards = ShardManager(config.shard_dir, config.max_shards, config.shard_idle_seconds,
+                      config.shard_warning_threshold, config.cross_shard_warnings)
+
+GRAPH_NODES.set_function(lambda: len(graph.graph))
+BACKGROUND_BACKLOG.set_function(lambda: len(background_tasks))
+renderer = GraphRenderer(config.render_max_nodes, config.render_layout_iterations)
+render_jobs = RenderJobs()
+
+SHARDS_LOADED.set_function(lambda: len(shards.loaded()))
+
+
+def get_llm() -> LLMJudger:
+    """Return the LLM judger, building the configured providers on first use."""
+    global llm
+    if llm is None:
+        llm = LLMJudger(config.create_llm_provider(), config.create_judge_provider())
+    return llm
+
+
+def get_graph_for(session_id: Optional[str]) -> KnowledgeGraph:
+    """The session's graph shard, or the global graph when no session id is given."""
+    if session_id is None:
+        return graph
+    try:
+        return shards.get(session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def warm_up() -> None:
+    """Load the sentiment model and retrieval backend ahead of the first request."""
+    start = time.perf_counter()
+    similarity_backend()
+    try:
+        get_sentiment_analyzer()
+    except Exception as e:
+        logger.warning(f"Sentiment model warm-up failed: {e}")
+    logger.info(f"Warm-up finished in {time.perf_counter() - start:.1f}s")
+
+
+async def evict_idle_shards() -> None:
+    """Periodically save and unload idle session shards, so their writes reach disk without other traffic."""
+    interval = min(60.0, max(1.0, shards.idle_seconds / 2))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # On the loop thread: handlers mutate shards there, so none is pickled mid-update
+            shards.evict_idle()
+        except Exception as e:
+            BACKGROUND_FAILURES.inc(task='shard_maintenance')
+            logger.error(f"Idle shard eviction failed: {e}")
+
+
+def spawn_background(coro, name: str) -> asyncio.Task:
+    """Run a coroutine in the background, keeping a reference and surfacing failures."""
+    task = asyncio.create_task(coro, name=name)
+    background_tasks.add(task)
+
+    def on_done(t: asyncio.Task) -> None:
+        background_tasks.discard(t)
+        if not t.cancelled() and t.exception() is not None:
+            BACKGROUND_FAILURES.inc(task=name)
+            logger.error(f"Background task {name} failed", exc_info=t.exception())
+
+    task.add_done_callback(on_done)
+    return task
 
 
 @app.get("/v1/health", response_model=HealthResponse)
@@ -100,6 +267,12 @@ async def health():
     return HealthResponse(status="ok", message="RegretGraph API is healthy.")
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of pipeline latencies, errors and gauges."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/v1/")
 async def root():
     """Root endpoint with friendly info message."""
@@ -109,11 +282,19 @@ async def root():
         "docs": "https://github.com/fersiguenza/ai-consciusness",
         "endpoints": [
             "POST /v1/prompt",
+            "POST /v1/prompt/batch",
             "GET /v1/graph",
             "GET /v1/clusters",
+            "GET /v1/analytics",
+            "POST /v1/graph/render",
+            "GET /v1/graph/render/{job_id}",
+            "GET /v1/graph/render/{job_id}/image",
             "GET /v1/config",
             "POST /v1/forget",
-            "GET /v1/health"
+            "POST /v1/rejudge",
+            "GET /v1/rejudge",
+            "GET /v1/health",
+            "GET /metrics"
         ]
     }
 
@@ -125,16 +306,15 @@ async def handle_prompt(
 ):
     """Process a prompt and return AI response with regret analysis asynchronously."""
     # Retrieve relevant past interactions for RAG
-    relevant = graph.retrieve_relevant(request.prompt, top_k=3)
-    context = ""
-    if relevant:
-        context = "Relevant past interactions for reference:\n" + "\n".join(
-            f"Past prompt: {r['prompt']}\nPast response: {r['response']}\nJudgment: {r['judgment']}\nRegret: {r['overall_regret']:.1f}\n"
-            for r in relevant
-        )
+    if request.session_id is None:
+        relevant = graph.retrieve_relevant(request.prompt, top_k=3)
+    else:
+        get_graph_for(request.session_id)  # rejects malformed session ids with a 400
+        relevant = shards.retrieve_relevant(request.session_id, request.prompt, top_k=3)
+    context = context_builder.build(relevant)
 
     # Generate AI response with context
-    ai_response = await llm.call_model_async(request.prompt, context=context)
+    ai_response = await get_llm().call_model_async(request.prompt, context=context)
 
     # Return response immediately
     response = PromptResponse(
@@ -149,14 +329,39 @@ async def handle_prompt(
     )
 
     # Process judgment and graph update in background
-    asyncio.create_task(process_judgment_and_update(request.prompt, ai_response))
+    spawn_background(process_judgment_and_update(request.prompt, ai_response, request.session_id), 'judgment_update')
 
     return response
 
 
-async def process_judgment_and_update(prompt: str, ai_response: str):
-    """Background task to process judgment and update graph."""
-    judgment, scores, explanation, hot_thought = await llm.judge_response_async(prompt, ai_response)
+@app.post("/v1/prompt/batch")
+async def handle_prompt_batch(
+    request: BatchPromptRequest,
+    username: str = Depends(verify_credentials)
+):
+    """Process many prompts concurrently, streaming one JSON line per result and a final summary."""
+    if not request.prompts:
+        raise HTTPException(status_code=400, detail="No prompts provided")
+    if len(request.prompts) > config.batch_max_size:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {config.batch_max_size} prompts")
+    concurrency = min(request.concurrency or config.batch_concurrency, config.batch_concurrency)
+    target = get_graph_for(request.session_id)
+    # Look the shard up again at commit time: it may be evicted while the prompts are processed
+    commit_graph = None if request.session_id is None else lambda: shards.get(request.session_id)
+
+    async def stream():
+        async for record in iter_batch(get_llm(), target, context_builder, request.prompts, concurrency,
+                                       commit_graph, config.judge_model):
+            if request.session_id is not None and 'summary' in record:
+                shards.sync_warnings(request.session_id, list(record['summary']['node_ids'].values()))
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+async def process_judgment_and_update(prompt: str, ai_response: str, session_id: Optional[str] = None):
+    """Background task to process judgment and update graph (the session's shard when one is given)."""
+    judgment, scores, explanation, hot_thought = await get_llm().judge_response_async(prompt, ai_response)
     overall_regret = (
         scores['ethical_regret'] +
         (10 - scores['factual_accuracy']) +
@@ -164,25 +369,100 @@ async def process_judgment_and_update(prompt: str, ai_response: str):
     ) / 3
     emotion = update_emotion(judgment, int(overall_regret), scores['factual_accuracy'], scores['emotional_impact'], ai_response)
 
-    node_id = graph.add(prompt, ai_response, judgment, scores, emotion)
+    # Look the shard up only now: it may have been evicted while the judge was running
+    target = graph if session_id is None else shards.get(session_id)
+    node_id = target.add(prompt, ai_response, judgment, scores, emotion, judge_model=config.judge_model)
+    if session_id is not None:
+        shards.sync_warnings(session_id, [node_id])
 
     # Optionally, trigger forgetting periodically
-    if len(graph.graph.nodes) % 10 == 0:  # Every 10 nodes
-        graph.causal_forgetting()
+    if len(target.graph.nodes) % 10 == 0:  # Every 10 nodes
+        target.causal_forgetting()
 
 
 @app.get("/v1/graph")
-async def get_graph():
+async def get_graph(session_id: Optional[str] = None):
     """Get the current knowledge graph structure."""
-    nodes = [{**graph.graph.nodes[n], 'id': n} for n in graph.graph.nodes]
-    edges = list(graph.graph.edges)
+    kg = get_graph_for(session_id)
+    nodes = [{**kg.graph.nodes[n], 'id': n} for n in kg.graph.nodes]
+    edges = list(kg.graph.edges)
     return {"nodes": nodes, "edges": edges}
 
 
+@app.post("/v1/graph/render", status_code=202)
+async def start_render(
+    request: RenderRequest,
+    username: str = Depends(verify_credentials)
+):
+    """Render a sampled or aggregated view of the graph to PNG in the background."""
+    kg = get_graph_for(request.session_id)
+    max_nodes = min(request.max_nodes or config.render_max_nodes, config.render_max_nodes)
+    try:
+        job = render_jobs.create(request.view, request.time_bucket, max_nodes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Render a copy so requests can keep mutating the graph meanwhile
+    snapshot = kg.graph.copy()
+    spawn_background(asyncio.to_thread(job.run, renderer, snapshot, request.session_id or 'global'), 'render')
+    return job.status()
+
+
+@app.get("/v1/graph/render/{job_id}")
+async def get_render_status(job_id: str):
+    """Get the state of a render job."""
+    job = render_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Render job not found")
+    return job.status()
+
+
+@app.get("/v1/graph/render/{job_id}/image")
+async def get_render_image(job_id: str):
+    """Download the PNG produced by a finished render job."""
+    job = render_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Render job not found")
+    if job.image is None:
+        raise HTTPException(status_code=409, detail=f"Render job is {job.state}")
+    return Response(job.image, media_type="image/png")
+
+
 @app.get("/v1/clusters")
-async def get_clusters():
+async def get_clusters(session_id: Optional[str] = None):
     """Get cluster analysis of the knowledge graph."""
-    return {"clusters": graph.analyze_clusters()}
+    return {"clusters": get_graph_for(session_id).analyze_clusters()}
+
+
+def parse_time(value: str) -> datetime:
+    """Parse an ISO-8601 query parameter as a naive local time, like stored node timestamps."""
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'  # fromisoformat only accepts a 'Z' suffix from Python 3.11
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid ISO-8601 time: {value}")
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+@app.get("/v1/analytics")
+async def get_analytics(
+    granularity: str = "hour",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    session_id: Optional[str] = None
+):
+    """Time-bucketed regret, emotion and judgment rollups; defaults to the last 24 buckets."""
+    kg = get_graph_for(session_id)
+    end_time = parse_time(end) if end else datetime.now()
+    if start:
+        start_time = parse_time(start)
+    else:
+        step = GRANULARITIES.get(granularity, GRANULARITIES['hour'])[1]
+        start_time = end_time - step * 23
+    try:
+        return kg.rollups.query(granularity, start_time, end_time)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/v1/config")
@@ -197,29 +477,86 @@ async def submit_feedback(
     username: str = Depends(verify_credentials)
 ):
     """Submit user feedback to adjust regret scores for a node."""
-    if request.node_id not in graph.graph.nodes:
+    kg = get_graph_for(request.session_id)
+    if request.node_id not in kg.graph.nodes:
         raise HTTPException(status_code=404, detail="Node not found")
     
     # Adjust scores based on rating: higher rating reduces regret
     adjustment = (request.rating - 5) * 0.5  # Scale adjustment
-    data = graph.graph.nodes[request.node_id]
-    scores = data.get('regret_scores', {'ethical_regret': 5, 'factual_accuracy': 5, 'emotional_impact': 5})
+    data = kg.graph.nodes[request.node_id]
+    scores = dict(data.get('regret_scores', {'ethical_regret': 5, 'factual_accuracy': 5, 'emotional_impact': 5}))
     scores['ethical_regret'] = max(1, min(10, scores['ethical_regret'] - adjustment))
     scores['factual_accuracy'] = max(1, min(10, scores['factual_accuracy'] + adjustment))
     scores['emotional_impact'] = max(1, min(10, scores['emotional_impact'] + adjustment))
-    data['regret_scores'] = scores
+    kg.update_node(request.node_id, regret_scores=scores)
+    if request.session_id is not None:
+        shards.sync_warnings(request.session_id, [request.node_id])
     return {"message": "Feedback submitted", "adjusted_scores": scores}
 
 
 @app.post("/v1/forget")
 async def trigger_forget(
+    session_id: Optional[str] = None,
     username: str = Depends(verify_credentials)
 ):
     """Trigger causal forgetting to prune old/low-regret nodes."""
-    removed_nodes = graph.causal_forgetting()
+    removed_nodes = get_graph_for(session_id).causal_forgetting()
     return {"removed_nodes": removed_nodes}
 
 
+@app.post("/v1/rejudge")
+async def start_rejudge(
+    request: RejudgeRequest,
+    username: str = Depends(verify_credentials)
+):
+    """Start (or resume) re-judging stored nodes with the configured judge model."""
+    global rejudge_job
+    if rejudge_job is not None and rejudge_job.state == 'running':
+        raise HTTPException(status_code=409, detail="Rejudge job already running")
+    rejudge_job = RejudgeJob(get_llm(), graph, config.judge_model, config.rejudge_checkpoint_path,
+                             request.chunk_size or config.rejudge_chunk_size,
+                             request.concurrency or config.rejudge_concurrency, shards)
+    spawn_background(rejudge_job.run(), 'rejudge')
+    return {"message": "Rejudge job started", "status": rejudge_job.status()}
+
+
+@app.get("/v1/rejudge")
+async def get_rejudge_status():
+    """Get progress, rate and ETA of the current re-judging job."""
+    if rejudge_job is None:
+        return {"state": "idle"}
+    return rejudge_job.status()
+
+
+@app.get("/v1/admin/profiles")
+async def list_profiles(
+    username: str = Depends(verify_credentials)
+):
+    """List retained slow-request traces, newest first."""
+    return {"profiles": profiler.traces()}
+
+
+@app.get("/v1/admin/profiles/{trace_id}")
+async def get_profile(
+    trace_id: int,
+    format: str = "text",
+    username: str = Depends(verify_credentials)
+):
+    """Download a trace as a text report or as raw pstats data (format=pstats)."""
+    trace = profiler.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "pstats":
+        return Response(trace.profile_data, media_type="application/octet-stream",
+                        headers={"Content-Disposition": f"attachment; filename=profile-{trace_id}.prof"})
+    return PlainTextResponse(trace.report)
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5050)
+    if config.workers > 1:
+        if config.graph_store == 'memory':
+            logger.warning("Multiple workers with graph_store 'memory' give each worker its own graph")
+        uvicorn.run("api.api_server:app", host="0.0.0.0", port=5050, workers=config.workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=5050)
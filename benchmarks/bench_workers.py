@@ -0,0 +1,98 @@
+"""Multi-worker throughput benchmark for the shared SQLite graph store.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_workers --workers 1,2,4 --output workers.json
+
+Each worker process opens its own SharedKnowledgeGraph on the same seeded database and runs a fixed
+mix of retrievals and writes, mimicking API workers. Throughput should grow with the worker count
+while reads dominate, since only writes are serialized by SQLite's write lock.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from typing import Dict, List
+
+from benchmarks.fakes import synthetic_prompt
+from benchmarks.run_benchmarks import build_graph
+from modules.store_module import SharedKnowledgeGraph
+
+
+def seed_store(path: str, size: int) -> None:
+    store = SharedKnowledgeGraph(path)
+    store.add_many([data for _, data in build_graph(size).graph.nodes(data=True)])
+    store.close()
+
+
+def worker(path: str, worker_id: int, ops: int, write_every: int, barrier) -> None:
+    logging.getLogger().setLevel(logging.WARNING)
+    store = SharedKnowledgeGraph(path)
+    store.retrieve_relevant("warm up")  # pay the scikit-learn import before the clock starts
+    barrier.wait()
+    for i in range(ops):
+        if write_every and i % write_every == 0:
+            store.add(f"worker {worker_id} prompt {i}", "benchmark response", "good",
+                      {'ethical_regret': 2, 'factual_accuracy': 8, 'emotional_impact': 7}, "happy")
+        else:
+            store.retrieve_relevant(synthetic_prompt(worker_id * ops + i))
+    store.close()
+
+
+def run(path: str, workers: int, total_ops: int, write_every: int) -> Dict[str, float]:
+    """Split `total_ops` across `workers` processes and time them from a common start barrier."""
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(workers + 1)
+    per_worker = total_ops // workers
+    procs = [ctx.Process(target=worker, args=(path, w, per_worker, write_every, barrier)) for w in range(workers)]
+    for p in procs:
+        p.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+    if any(p.exitcode for p in procs):
+        raise RuntimeError(f"A worker failed with {workers} workers")
+    ops = per_worker * workers
+    return {'median_ms': round(elapsed / ops * 1000, 3), 'ops_per_sec': round(ops / elapsed, 2),
+            'elapsed_s': round(elapsed, 3)}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="RegretGraph multi-worker store benchmark")
+    parser.add_argument('--workers', default='1,2,4', help="Comma-separated worker counts")
+    parser.add_argument('--size', type=int, default=500, help="Seeded graph size")
+    parser.add_argument('--ops', type=int, default=400, help="Total operations per run, split across workers")
+    parser.add_argument('--write-every', type=int, default=10, help="One write per N operations (0 = read only)")
+    parser.add_argument('--output', help="Write machine-readable results to this JSON file")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in (int(w) for w in args.workers.split(',')):
+            path = os.path.join(tmp, f"graph-{count}.db")
+            seed_store(path, args.size)
+            results[f'store_mix[n={args.size},workers={count}]'] = run(path, count, args.ops, args.write_every)
+
+    for name, r in results.items():
+        print(f"{name:40s} {r['median_ms']:>10.3f} ms  {r['ops_per_sec']:>10.2f} ops/s")
+    if args.output:
+        report = {'meta': {'timestamp': datetime.now().isoformat(), 'python': platform.python_version(),
+                           'platform': platform.platform(), 'cpus': os.cpu_count(), 'args': vars(args)},
+                  'results': results}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
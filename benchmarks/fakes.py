@@ -0,0 +1,59 @@
+import hashlib
+import json
+import random
+import time
+
+from typing import Dict, List
+
+from modules.llm_module import LLMProvider
+
+
+def stable_hash(text: str) -> int:
+    """Process-independent hash (unlike the built-in, which is salted per interpreter)."""
+    return int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8], 16)
+
+
+class FakeLLMProvider(LLMProvider):
+    """Deterministic LLM provider with configurable latency and jitter.
+
+    Responses depend only on the prompt text; judge prompts get a JSON verdict whose scores are
+    derived from the same hash, so graph contents are identical across runs.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 0, model_name: str = "fake") -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.model_name = model_name
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    def call_model(self, prompt: str, max_tokens: int = 100) -> str:
+        self.calls += 1
+        delay = self.latency_ms + (self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        h = stable_hash(prompt)
+        if "Critically evaluate" in prompt:
+            return json.dumps({'judgment': ('good', 'neutral', 'bad')[h % 3], 'ethical': 1 + h % 10,
+                               'factual': 1 + (h >> 4) % 10, 'emotional': 1 + (h >> 8) % 10,
+                               'reflection': "The judgment shows the response was weighed on its merits."})
+        words = WORDS[h % len(WORDS):] + WORDS[:h % len(WORDS)]
+        return " ".join(words[:max(1, min(max_tokens, 40))])
+
+
+class StubSentimentAnalyzer:
+    """Drop-in replacement for the transformers sentiment pipeline with deterministic labels."""
+
+    def __call__(self, text: str) -> List[Dict[str, object]]:
+        return [{'label': f"LABEL_{stable_hash(text) % 3}", 'score': 0.9}]
+
+
+WORDS = ("regret memory graph ethics judgment reflection emotion mood prompt response learning mistake "
+         "warning forgetting cluster context answer question kindness accuracy harm truth joke weather "
+         "history science music travel health money code python network model").split()
+
+
+def synthetic_prompt(i: int) -> str:
+    """Deterministic prompt text for the i-th synthetic interaction."""
+    h = stable_hash(str(i))
+    return " ".join(WORDS[(h >> shift) % len(WORDS)] for shift in range(0, 24, 3))
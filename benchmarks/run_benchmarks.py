@@ -0,0 +1,246 @@
+"""Deterministic performance benchmarks for RegretGraph.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --output bench.json --baseline benchmarks/baseline.json
+
+Every benchmark uses FakeLLMProvider and StubSentimentAnalyzer, so results only reflect this code base.
+Each result is also stored relative to a fixed pure-Python calibration workload run on the same machine,
+and baselines are compared on those relative numbers, so a uniformly faster or slower host is not a
+regression. The exit code is 1 when any benchmark is slower than its baseline by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from typing import Callable, Dict, List
+
+from benchmarks.fakes import FakeLLMProvider, StubSentimentAnalyzer, synthetic_prompt, stable_hash
+from modules.emotion_module import set_sentiment_analyzer
+from modules.graph_module import KnowledgeGraph
+from modules.llm_module import LLMJudger
+
+
+AUTH = {'Authorization': 'Basic YWRtaW46c2VjcmV0'}  # admin:secret
+
+
+def build_graph(size: int) -> KnowledgeGraph:
+    """Graph of `size` synthetic interactions spread over the last 30 days."""
+    kg = KnowledgeGraph()
+    now = datetime.now()
+    records = []
+    for i in range(size):
+        records.append({
+            'prompt': synthetic_prompt(i),
+            'response': f"Synthetic response {i}",
+            'judgment': ('good', 'neutral', 'bad')[i % 3],
+            'regret_scores': {'ethical_regret': 1 + i % 10, 'factual_accuracy': 1 + (i * 7) % 10,
+                              'emotional_impact': 1 + (i * 3) % 10},
+            'emotion': 'neutral',
+            'timestamp': (now - timedelta(days=(i * 13) % 30, seconds=stable_hash(str(i)) % 86400)).isoformat(),
+        })
+    kg.add_many(records)
+    return kg
+
+
+def measure(func: Callable[[], None], repeat: int) -> Dict[str, float]:
+    """Run func `repeat` times (after one warm-up call) and summarise per-call wall time."""
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    return {'median_ms': round(median * 1000, 3), 'min_ms': round(min(timings) * 1000, 3),
+            'ops_per_sec': round(1 / median, 2) if median > 0 else 0.0}
+
+
+def bench_graph(size: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    kg = build_graph(size)
+    results[f'retrieval[n={size}]'] = measure(lambda: kg.retrieve_relevant("tell me about regret and ethics"), repeat)
+
+    def add():
+        kg.add("benchmark prompt", "benchmark response", "good",
+               {'ethical_regret': 2, 'factual_accuracy': 8, 'emotional_impact': 7}, "happy")
+    results[f'add[n={size}]'] = measure(add, repeat)
+
+    def forget():
+        fresh = KnowledgeGraph()
+        fresh.graph = kg.graph.copy()
+        fresh.causal_forgetting(regret_threshold=5, age_days_threshold=7)
+    results[f'forgetting[n={size}]'] = measure(forget, max(1, repeat // 5))
+    results[f'clustering[n={size}]'] = measure(kg.analyze_clusters, max(1, repeat // 5))
+    return results
+
+
+def calibration_workload() -> None:
+    """Fixed CPU-bound mix of hashing, sorting and dict churn, roughly like the graph code paths."""
+    table = {}
+    for i in range(20000):
+        key = stable_hash(f"calibration-{i}") % 5000
+        table[key] = table.get(key, 0) + i
+    sorted(table.items(), key=lambda kv: (kv[1], kv[0]))
+
+
+def calibrate(repeat: int) -> float:
+    """Median wall time of the calibration workload in ms; the unit for relative results."""
+    return measure(calibration_workload, repeat)['median_ms']
+
+
+def normalize(results: Dict[str, Dict[str, float]], calibration_ms: float) -> None:
+    """Add a machine-independent 'relative' field (median / calibration median) to every result."""
+    for r in results.values():
+        r['relative'] = round(r['median_ms'] / calibration_ms, 6) if calibration_ms > 0 else 0.0
+
+
+IMPORT_TARGETS = ('api.api_server', 'main')
+
+
+def bench_imports(repeat: int) -> Dict[str, Dict[str, float]]:
+    """Cold import time of the entrypoints, each measured in a fresh interpreter."""
+    results = {}
+    for module in IMPORT_TARGETS:
+        code = (f"import time; start = time.perf_counter(); import {module}; "
+                f"print(time.perf_counter() - start)")
+        timings = []
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+            timings.append(float(out.stdout.strip().splitlines()[-1]))
+        median = statistics.median(timings)
+        results[f'import[{module}]'] = {'median_ms': round(median * 1000, 3), 'min_ms': round(min(timings) * 1000, 3),
+                                        'ops_per_sec': round(1 / median, 2) if median > 0 else 0.0}
+    return results
+
+
+def bench_api(size: int, requests: int, concurrency: int, latency_ms: float, jitter_ms: float) -> Dict[str, Dict[str, float]]:
+    """End-to-end /v1/prompt and /v1/feedback throughput through the ASGI app with fake providers."""
+    import httpx
+    from api import api_server
+
+    api_server.graph = build_graph(size)
+    api_server.llm = LLMJudger(FakeLLMProvider(latency_ms, jitter_ms, seed=1),
+                               FakeLLMProvider(latency_ms, jitter_ms, seed=2))
+    results = {}
+
+    async def run() -> None:
+        transport = httpx.ASGITransport(app=api_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one(i: int) -> None:
+                async with semaphore:
+                    resp = await client.post('/v1/prompt', json={'prompt': synthetic_prompt(size + i)}, headers=AUTH)
+                    resp.raise_for_status()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(requests)))
+            responded = time.perf_counter() - start
+            while api_server.background_tasks:
+                await asyncio.sleep(0.001)
+            completed = time.perf_counter() - start
+            results[f'prompt_responses[n={size}]'] = {
+                'median_ms': round(responded / requests * 1000, 3), 'ops_per_sec': round(requests / responded, 2)}
+            results[f'prompt_end_to_end[n={size}]'] = {
+                'median_ms': round(completed / requests * 1000, 3), 'ops_per_sec': round(requests / completed, 2)}
+
+            node_ids = list(api_server.graph.graph.nodes)[:requests]
+            start = time.perf_counter()
+            for i, node_id in enumerate(node_ids):
+                resp = await client.post('/v1/feedback', json={'node_id': node_id, 'rating': 1 + i % 10}, headers=AUTH)
+                resp.raise_for_status()
+            elapsed = time.perf_counter() - start
+            results[f'feedback[n={size}]'] = {
+                'median_ms': round(elapsed / len(node_ids) * 1000, 3), 'ops_per_sec': round(len(node_ids) / elapsed, 2)}
+
+    asyncio.run(run())
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """Names of benchmarks slower than baseline * (1 + tolerance).
+
+    Uses the calibration-relative numbers when both sides have them, else the absolute medians.
+    """
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        key = 'relative' if 'relative' in base and 'relative' in current else 'median_ms'
+        if base.get(key, 0) <= 0:
+            continue
+        ratio = current[key] / base[key]
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: {current['median_ms']}ms vs baseline {base['median_ms']}ms "
+                               f"({ratio:.2f}x {'relative' if key == 'relative' else 'absolute'})")
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="RegretGraph benchmark suite")
+    parser.add_argument('--sizes', default='100,1000', help="Comma-separated graph sizes")
+    parser.add_argument('--repeat', type=int, default=20, help="Repetitions per micro-benchmark")
+    parser.add_argument('--requests', type=int, default=50, help="Requests per end-to-end API run")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent API requests")
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="Fake provider latency")
+    parser.add_argument('--jitter-ms', type=float, default=1.0, help="Fake provider latency jitter")
+    parser.add_argument('--skip-api', action='store_true', help="Only run graph micro-benchmarks")
+    parser.add_argument('--import-repeat', type=int, default=5, help="Fresh interpreters per import-time benchmark")
+    parser.add_argument('--output', help="Write machine-readable results to this JSON file")
+    parser.add_argument('--baseline', help="Baseline JSON file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="Allowed slowdown vs baseline (0.5 = 50%%)")
+    parser.add_argument('--update-baseline', action='store_true', help="Overwrite --baseline with these results")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    set_sentiment_analyzer(StubSentimentAnalyzer())
+    calibration_ms = calibrate(max(5, args.repeat))
+    results: Dict[str, Dict[str, float]] = {}
+    if args.import_repeat > 0:
+        results.update(bench_imports(args.import_repeat))
+    for size in (int(s) for s in args.sizes.split(',')):
+        results.update(bench_graph(size, args.repeat))
+        if not args.skip_api:
+            results.update(bench_api(size, args.requests, args.concurrency, args.latency_ms, args.jitter_ms))
+    normalize(results, calibration_ms)
+
+    report = {
+        'meta': {'timestamp': datetime.now().isoformat(), 'python': platform.python_version(),
+                 'platform': platform.platform(), 'processor': platform.processor() or platform.machine(),
+                 'cpu_count': os.cpu_count(), 'calibration_ms': calibration_ms, 'args': vars(args)},
+        'results': results,
+    }
+    for name, r in results.items():
+        print(f"{name:40s} {r['median_ms']:>10.3f} ms  {r['relative']:>10.3f} rel  {r['ops_per_sec']:>10.2f} ops/s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
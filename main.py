@@ -3,18 +3,20 @@ from modules.graph_module import KnowledgeGraph
 from modules.llm_module import LLMJudger
 from modules.emotion_module import update_emotion, update_mood
 from modules.config_module import Config
+from modules.context_module import ContextBuilder
+from modules.batch_module import iter_batch
 from rich.console import Console
-import matplotlib.pyplot as plt
-import networkx as nx
+import argparse
+import asyncio
+import json
 import signal
 import sys
 
 console = Console()
 config = Config()
 graph = KnowledgeGraph()
-llm_provider = config.create_llm_provider()
-judge_provider = config.create_judge_provider()
-llm = LLMJudger(llm_provider, judge_provider)
+llm = None  # Providers are built when the CLI starts, not on import
+context_builder = ContextBuilder(config.context_token_budget, config.context_snippet_chars)
 regret_threshold = config.regret_threshold
 forgetting_decay = config.forgetting_decay
 mood_threshold = config.mood_threshold
@@ -26,8 +28,54 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
+def read_prompts(path: str) -> list:
+    """Read prompts from a JSONL file; each line is a JSON string or an object with a 'prompt' key."""
+    prompts = []
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            prompts.append(item['prompt'] if isinstance(item, dict) else str(item))
+    return prompts
+
+
+async def run_bulk(in_path: str, out_path: str, concurrency: int) -> None:
+    """Offline bulk mode: process a JSONL file of prompts and stream results to a JSONL file."""
+    graph.load()
+    prompts = read_prompts(in_path)
+    status = Console(stderr=True)
+    status.print(f"Processing {len(prompts)} prompts with concurrency {concurrency}...", style="cyan")
+    out = open(out_path, 'w') if out_path != '-' else sys.stdout
+    try:
+        async for record in iter_batch(llm, graph, context_builder, prompts, concurrency,
+                                       judge_model=config.judge_model):
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            if 'summary' in record:
+                summary = record['summary']
+                status.print(f"Done: {summary['succeeded']}/{summary['processed']} succeeded in "
+                              f"{summary['elapsed_seconds']}s ({summary['prompts_per_second']} prompts/s)",
+                              style="green")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    graph.save()
+
+
 # Example CLI entrypoint
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RegretGraph CLI")
+    parser.add_argument('--bulk', metavar='PROMPTS_JSONL', help="Process prompts from a JSONL file instead of interactively")
+    parser.add_argument('--out', default='-', help="Output JSONL file for bulk results (default: stdout)")
+    parser.add_argument('--concurrency', type=int, default=config.batch_concurrency,
+                        help="Concurrent prompts in bulk mode")
+    args = parser.parse_args()
+    llm = LLMJudger(config.create_llm_provider(), config.create_judge_provider())
+    if args.bulk:
+        asyncio.run(run_bulk(args.bulk, args.out, args.concurrency))
+        sys.exit(0)
+
     signal.signal(signal.SIGINT, signal_handler)
     console.print("🧠 RegretGraph AI POC (Modular) 🧠", style="bold magenta", justify="center")
 
@@ -37,17 +85,12 @@ if __name__ == "__main__":
             graph.save()
             break
         relevant = graph.retrieve_relevant(prompt, top_k=3)
-        context = ""
-        if relevant:
-            context = "Relevant past interactions:\n" + "\n".join(
-                f"Past: {r['prompt']} -> {r['response']} (Regret: {r['overall_regret']:.1f})"
-                for r in relevant
-            )
+        context = context_builder.build(relevant, header="Relevant past interactions:")
         ai_response = llm.call_model(prompt, context=context)
         judgment, scores, explanation, hot_thought = llm.judge_response(prompt, ai_response)
         overall_regret = (scores['ethical_regret'] + (10 - scores['factual_accuracy']) + (10 - scores['emotional_impact'])) / 3
         emotion = update_emotion(judgment, int(overall_regret), scores['factual_accuracy'], scores['emotional_impact'], ai_response)
-        node_id = graph.add(prompt, ai_response, judgment, scores, emotion)
+        node_id = graph.add(prompt, ai_response, judgment, scores, emotion, judge_model=config.judge_model)
         avg_regret = sum((data.get('regret_scores', {}).get('ethical_regret', 5) +
                           (10 - data.get('regret_scores', {}).get('factual_accuracy', 5)) +
                           (10 - data.get('regret_scores', {}).get('emotional_impact', 5))) / 3
@@ -114,13 +157,5 @@ def check_past_regrets(prompt):
 
 def visualize_graph():
     """Visualize and save the knowledge graph."""
-    plt.figure(figsize=(10, 8))
-    pos = nx.spring_layout(graph.graph)
-    node_colors = ['red' if graph.graph.nodes[n].get('regret_score', 0) > 7 else 'lightblue' for n in graph.graph.nodes]
-    labels = {n: graph.graph.nodes[n]['prompt'][:20] +
-              ('...' if len(graph.graph.nodes[n]['prompt']) > 20 else '')
-              for n in graph.graph.nodes}
-    nx.draw(graph.graph, pos, labels=labels, node_color=node_colors, font_size=8, node_size=500)
-    plt.title("RegretGraph Knowledge Graph (Red: High Regret)")
-    plt.savefig('graphs/graph.png')
+    graph.visualize('graphs/graph.png')
     console.print("Graph visualization saved as graphs/graph.png", style="green")
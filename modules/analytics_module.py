@@ -0,0 +1,164 @@
+from collections import Counter
+from datetime import datetime, timedelta
+import threading
+import time
+
+from typing import Any, Dict, Iterable, List, Optional
+
+# ISO timestamp prefix length and step per rollup granularity
+GRANULARITIES = {'minute': (16, timedelta(minutes=1)), 'hour': (13, timedelta(hours=1)), 'day': (10, timedelta(days=1))}
+DEFAULT_RETENTION = {'minute': timedelta(days=2), 'hour': timedelta(days=90), 'day': None}
+SCORE_KEYS = ('ethical_regret', 'factual_accuracy', 'emotional_impact')
+DEFAULT_SCORES = {'ethical_regret': 5, 'factual_accuracy': 5, 'emotional_impact': 5}
+MAX_BUCKETS = 1000  # per query
+
+
+class Bucket:
+    """Running totals for the interactions whose timestamp falls in one time bucket."""
+
+    __slots__ = ('count', 'score_sums', 'emotions', 'judgments')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.score_sums = dict.fromkeys(SCORE_KEYS, 0.0)
+        self.emotions: Counter = Counter()
+        self.judgments: Counter = Counter()
+
+    def apply(self, attrs: Dict[str, Any], sign: int) -> None:
+        self.count += sign
+        scores = attrs.get('regret_scores') or DEFAULT_SCORES
+        for key in SCORE_KEYS:
+            self.score_sums[key] += sign * scores.get(key, 5)
+        self.emotions[attrs.get('emotion', 'unknown')] += sign
+        self.judgments[attrs.get('judgment', 'unknown')] += sign
+
+    def merge(self, other: 'Bucket') -> None:
+        self.count += other.count
+        for key in SCORE_KEYS:
+            self.score_sums[key] += other.score_sums[key]
+        self.emotions.update(other.emotions)
+        self.judgments.update(other.judgments)
+
+    def summary(self) -> Dict[str, Any]:
+        averages = {key: round(total / self.count, 3) for key, total in self.score_sums.items()} if self.count else {}
+        # Overall regret is linear in the three scores, so the mean of overall regret comes from the sums
+        overall = (round((averages['ethical_regret'] + (10 - averages['factual_accuracy']) +
+                          (10 - averages['emotional_impact'])) / 3, 3) if self.count else None)
+        return {'count': self.count, 'avg_scores': averages, 'avg_overall_regret': overall,
+                'emotions': {k: v for k, v in self.emotions.items() if v > 0},
+                'judgments': {k: v for k, v in self.judgments.items() if v > 0}}
+
+
+class RegretRollups:
+    """Incremental per-minute/hour/day rollups of interaction counts, score sums and label histograms.
+
+    The owning KnowledgeGraph calls add/remove/update on every mutation, so a time-windowed query
+    touches one bucket per step instead of scanning nodes. Minute and hour buckets older than their
+    retention are dropped; a node removed or updated after its bucket was dropped leaves that
+    granularity untouched.
+    """
+
+    def __init__(self, retention: Optional[Dict[str, Optional[timedelta]]] = None) -> None:
+        self.retention = retention or DEFAULT_RETENTION
+        self._buckets: Dict[str, Dict[str, Bucket]] = {g: {} for g in GRANULARITIES}
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+
+    def _apply(self, attrs: Dict[str, Any], sign: int, skip: Iterable[str] = ()) -> None:
+        timestamp = attrs.get('timestamp')
+        if not timestamp:
+            return
+        for granularity, (width, _) in GRANULARITIES.items():
+            if granularity in skip:
+                continue
+            key = timestamp[:width]
+            buckets = self._buckets[granularity]
+            bucket = buckets.get(key)
+            if bucket is None:
+                if sign < 0:
+                    continue
+                bucket = buckets[key] = Bucket()
+            bucket.apply(attrs, sign)
+            if bucket.count <= 0:
+                del buckets[key]
+
+    def _cutoff(self, granularity: str, now: datetime) -> Optional[str]:
+        """Key of the oldest bucket retained for `granularity`, or None when it is kept forever."""
+        keep = self.retention.get(granularity)
+        return None if keep is None else (now - keep).isoformat()[:GRANULARITIES[granularity][0]]
+
+    def add(self, attrs: Dict[str, Any]) -> None:
+        with self._lock:
+            self._apply(attrs, 1)
+            self._prune()
+
+    def add_many(self, records: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            for attrs in records:
+                self._apply(attrs, 1)
+            self._prune()
+
+    def remove(self, attrs: Dict[str, Any]) -> None:
+        with self._lock:
+            self._apply(attrs, -1)
+
+    def update(self, old: Dict[str, Any], new: Dict[str, Any]) -> None:
+        timestamp = old.get('timestamp') or ''
+        now = datetime.now()
+        with self._lock:
+            # A node whose bucket was pruned (or is past retention) must not recreate it holding only itself
+            stale = [g for g, (width, _) in GRANULARITIES.items()
+                     if timestamp[:width] not in self._buckets[g]
+                     or timestamp[:width] < (self._cutoff(g, now) or '')]
+            self._apply(old, -1, stale)
+            self._apply(new, 1, stale)
+
+    def rebuild(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Recompute every bucket from scratch (after loading a graph)."""
+        with self._lock:
+            self._buckets = {g: {} for g in GRANULARITIES}
+            for attrs in records:
+                self._apply(attrs, 1)
+            self._pruned_at = 0.0
+            self._prune()
+
+    def _prune(self, interval: float = 60.0) -> None:
+        # At most once per interval: drop buckets older than their granularity's retention
+        if time.monotonic() - self._pruned_at < interval:
+            return
+        self._pruned_at = time.monotonic()
+        now = datetime.now()
+        for granularity in GRANULARITIES:
+            cutoff = self._cutoff(granularity, now)
+            if cutoff is None:
+                continue
+            buckets = self._buckets[granularity]
+            for key in [k for k in buckets if k < cutoff]:
+                del buckets[key]
+
+    def query(self, granularity: str, start: datetime, end: datetime) -> Dict[str, Any]:
+        """Per-bucket summaries (non-empty buckets only) and window totals for [start, end]."""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unsupported granularity: {granularity}")
+        width, step = GRANULARITIES[granularity]
+        if end < start:
+            raise ValueError("end is before start")
+        if (end - start) / step > MAX_BUCKETS:
+            raise ValueError(f"Window spans more than {MAX_BUCKETS} {granularity} buckets")
+        buckets: List[Dict[str, Any]] = []
+        totals = Bucket()
+        current = datetime.fromisoformat(start.isoformat()[:width])  # start of start's bucket
+        last_key = end.isoformat()[:width]
+        with self._lock:
+            table = self._buckets[granularity]
+            while True:
+                key = current.isoformat()[:width]
+                if key > last_key:
+                    break
+                bucket = table.get(key)
+                if bucket is not None:
+                    buckets.append({'bucket': key, **bucket.summary()})
+                    totals.merge(bucket)
+                current += step
+        return {'granularity': granularity, 'start': start.isoformat(), 'end': end.isoformat(),
+                'buckets': buckets, 'totals': totals.summary()}
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from .context_module import ContextBuilder
+from .emotion_module import update_emotion
+from .graph_module import KnowledgeGraph, overall_regret
+
+
+logger = logging.getLogger(__name__)
+
+
+async def process_prompt(llm: Any, graph: KnowledgeGraph, context_builder: ContextBuilder, prompt: str) -> Dict[str, Any]:
+    """Run retrieval, generation, judgment and emotion for one prompt without touching the graph."""
+    relevant = graph.retrieve_relevant(prompt, top_k=3)
+    context = context_builder.build(relevant)
+    response = await llm.call_model_async(prompt, context=context)
+    judgment, scores, explanation, hot_thought = await llm.judge_response_async(prompt, response)
+    regret = overall_regret(scores)
+    emotion = await asyncio.to_thread(update_emotion, judgment, int(regret), scores['factual_accuracy'],
+                                      scores['emotional_impact'], response)
+    return {
+        'prompt': prompt,
+        'response': response,
+        'judgment': judgment,
+        'regret_scores': scores,
+        'overall_regret': regret,
+        'emotion': emotion,
+        'higher_order_thought': hot_thought,
+    }
+
+
+async def iter_batch(llm: Any, graph: KnowledgeGraph, context_builder: ContextBuilder, prompts: List[str],
+                     concurrency: int = 4,
+                     commit_graph: Optional[Callable[[], KnowledgeGraph]] = None,
+                     judge_model: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Process prompts with bounded concurrency, yielding each result as it completes.
+
+    Successful results are inserted with a single bulk graph commit once every prompt is done, into
+    `graph` or, when given, the graph returned by `commit_graph` at that moment (a session shard may
+    have been evicted and reloaded meanwhile), and stamped with `judge_model`. The final item yielded
+    is a ``{'summary': ...}`` record with node ids and throughput.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    start = time.perf_counter()
+
+    async def run(index: int, prompt: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                record = await process_prompt(llm, graph, context_builder, prompt)
+            except Exception as e:
+                logger.error(f"Batch item {index} failed: {e}")
+                record = {'prompt': prompt, 'error': str(e)}
+            record['index'] = index
+            return record
+
+    tasks = [asyncio.create_task(run(i, p)) for i, p in enumerate(prompts)]
+    completed = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            record = await next_done
+            completed.append(record)
+            yield record
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    succeeded = sorted((r for r in completed if 'error' not in r), key=lambda r: r['index'])
+    target = commit_graph() if commit_graph is not None else graph
+    node_ids = target.add_many(succeeded, judge_model)
+    elapsed = time.perf_counter() - start
+    yield {'summary': {
+        'processed': len(completed),
+        'succeeded': len(succeeded),
+        'failed': len(completed) - len(succeeded),
+        'node_ids': {r['index']: node_id for r, node_id in zip(succeeded, node_ids)},
+        'elapsed_seconds': round(elapsed, 3),
+        'prompts_per_second': round(len(completed) / elapsed, 3) if elapsed > 0 else 0.0,
+    }}
@@ -1,7 +1,7 @@
 import yaml
 import os
 
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional
 
 
 class Config:
@@ -25,6 +25,10 @@ class Config:
     def openai_api_key(self) -> Optional[str]:
         return self.get('openai_api_key', os.getenv('OPENAI_API_KEY'))
 
+    @property
+    def ollama_url(self) -> str:
+        return self.get('ollama_url', os.getenv('OLLAMA_URL', 'http://localhost:11434/api/generate'))
+
     @property
     def bedrock_region(self) -> str:
         return self.get('bedrock_region', 'us-east-1')
@@ -45,6 +49,122 @@ class Config:
     def mood_threshold(self) -> int:
         return self.get('mood_threshold', 5)
 
+    @property
+    def context_token_budget(self) -> int:
+        return self.get('context_token_budget', 512)
+
+    @property
+    def context_snippet_chars(self) -> int:
+        return self.get('context_snippet_chars', 300)
+
+    @property
+    def batch_concurrency(self) -> int:
+        return self.get('batch_concurrency', 4)
+
+    @property
+    def batch_max_size(self) -> int:
+        return self.get('batch_max_size', 100)
+
+    @property
+    def rejudge_chunk_size(self) -> int:
+        return self.get('rejudge_chunk_size', 20)
+
+    @property
+    def rejudge_concurrency(self) -> int:
+        return self.get('rejudge_concurrency', 4)
+
+    @property
+    def rejudge_checkpoint_path(self) -> str:
+        return self.get('rejudge_checkpoint_path', 'graphs/rejudge_checkpoint.json')
+
+    @property
+    def profiling_enabled(self) -> bool:
+        return self.get('profiling_enabled', False)
+
+    @property
+    def profiling_sample_rate(self) -> float:
+        return self.get('profiling_sample_rate', 0.0)
+
+    @property
+    def profiling_slow_threshold_ms(self) -> float:
+        return self.get('profiling_slow_threshold_ms', 1000)
+
+    @property
+    def profiling_ring_size(self) -> int:
+        return self.get('profiling_ring_size', 20)
+
+    @property
+    def warmup(self) -> bool:
+        return self.get('warmup', False)
+
+    @property
+    def fallback_providers(self) -> List[Dict[str, str]]:
+        return self.get('fallback_providers') or []
+
+    @property
+    def judge_fallback_provider(self) -> str:
+        return self.get('judge_fallback_provider', self.judge_provider)
+
+    @property
+    def judge_fallback_model(self) -> Optional[str]:
+        return self.get('judge_fallback_model')
+
+    @property
+    def judge_pressure_latency_seconds(self) -> Optional[float]:
+        return self.get('judge_pressure_latency_seconds', 10)
+
+    @property
+    def hedge_percentile(self) -> float:
+        return self.get('hedge_percentile', 0.95)
+
+    @property
+    def circuit_failure_threshold(self) -> int:
+        return self.get('circuit_failure_threshold', 3)
+
+    @property
+    def circuit_cooldown_seconds(self) -> float:
+        return self.get('circuit_cooldown_seconds', 30)
+
+    @property
+    def graph_store(self) -> str:
+        return self.get('graph_store', 'memory')
+
+    @property
+    def graph_store_path(self) -> str:
+        return self.get('graph_store_path', 'graphs/graph.db')
+
+    @property
+    def workers(self) -> int:
+        return self.get('workers', 1)
+
+    @property
+    def shard_dir(self) -> str:
+        return self.get('shard_dir', 'graphs/shards')
+
+    @property
+    def max_shards(self) -> int:
+        return self.get('max_shards', 64)
+
+    @property
+    def shard_idle_seconds(self) -> float:
+        return self.get('shard_idle_seconds', 900)
+
+    @property
+    def shard_warning_threshold(self) -> float:
+        return self.get('shard_warning_threshold', 7)
+
+    @property
+    def cross_shard_warnings(self) -> bool:
+        return self.get('cross_shard_warnings', True)
+
+    @property
+    def render_max_nodes(self) -> int:
+        return self.get('render_max_nodes', 500)
+
+    @property
+    def render_layout_iterations(self) -> int:
+        return self.get('render_layout_iterations', 50)
+
     @property
     def judge_provider(self) -> str:
         return self.get('judge_provider', self.llm_provider)
@@ -54,32 +174,68 @@ class Config:
         return self.get('judge_model', self.model)
 
     def create_llm_provider(self):
-        """Create and return the appropriate LLM provider based on configuration."""
-        from .llm_module import OllamaProvider, OpenAIProvider, BedrockProvider
+        """Create and return the appropriate LLM provider based on configuration.
+
+        With `fallback_providers` configured, the primary provider is wrapped in a RoutingProvider
+        that hedges slow calls and fails over to the fallbacks.
+        """
+        primary = self._build_provider(self.llm_provider, self.model, "LLM provider")
+        fallbacks = []
+        for i, entry in enumerate(self.fallback_providers):
+            if not isinstance(entry, dict) or not isinstance(entry.get('provider'), str):
+                raise ValueError(f"fallback_providers[{i}] needs a 'provider' name, got: {entry!r}")
+            fallbacks.append(self._build_provider(entry['provider'], entry.get('model'), "fallback provider"))
+        if not fallbacks:
+            return primary
+        return self._create_router([primary] + fallbacks)
 
-        provider_type = self.llm_provider.lower()
-
-        if provider_type == 'ollama':
-            return OllamaProvider(self.ollama_url, self.model)
-        elif provider_type == 'openai':
-            if not self.openai_api_key:
-                raise ValueError("OpenAI API key required for OpenAI provider")
-            return OpenAIProvider(self.openai_api_key, self.model)
-        elif provider_type == 'bedrock':
-            return BedrockProvider(self.bedrock_region, self.bedrock_model_id)
     def create_judge_provider(self):
-        """Create and return the judge LLM provider."""
+        """Create and return the judge LLM provider.
+
+        With `judge_fallback_model` configured, judge traffic moves to that cheaper model while the
+        configured judge is failing or slower than `judge_pressure_latency_seconds`.
+        """
+        judge = self._build_provider(self.judge_provider, self.judge_model, "judge provider")
+        if not self.judge_fallback_model:
+            return judge
+        fallback = self._build_provider(self.judge_fallback_provider, self.judge_fallback_model, "judge fallback provider")
+        return self._create_router([judge], fallbacks=[fallback],
+                                   pressure_latency_seconds=self.judge_pressure_latency_seconds)
+
+    def create_graph(self):
+        """Create the knowledge graph backend: in-process ('memory') or shared across workers ('sqlite')."""
+        store = self.graph_store.lower()
+        if store == 'memory':
+            from .graph_module import KnowledgeGraph
+            return KnowledgeGraph()
+        elif store == 'sqlite':
+            from .store_module import SharedKnowledgeGraph
+            return SharedKnowledgeGraph(self.graph_store_path)
+        else:
+            raise ValueError(f"Unsupported graph store: {store}")
+
+    def _create_router(self, providers, fallbacks=None, pressure_latency_seconds=None):
+        """Wrap providers in a RoutingProvider tuned by the hedging and circuit breaker settings."""
+        from .llm_module import RoutingProvider
+
+        return RoutingProvider(providers, fallbacks, hedge_percentile=self.hedge_percentile,
+                               failure_threshold=self.circuit_failure_threshold,
+                               cooldown_seconds=self.circuit_cooldown_seconds,
+                               pressure_latency_seconds=pressure_latency_seconds)
+
+    def _build_provider(self, provider_type: str, model: Optional[str], role: str):
+        """Instantiate one provider; `role` names it in configuration errors."""
         from .llm_module import OllamaProvider, OpenAIProvider, BedrockProvider
 
-        provider_type = self.judge_provider.lower()
+        provider_type = provider_type.lower()
 
         if provider_type == 'ollama':
-            return OllamaProvider(self.ollama_url, self.judge_model)
+            return OllamaProvider(self.ollama_url, model or self.model)
         elif provider_type == 'openai':
             if not self.openai_api_key:
-                raise ValueError("OpenAI API key required for judge provider")
-            return OpenAIProvider(self.openai_api_key, self.judge_model)
+                raise ValueError(f"OpenAI API key required for {role}")
+            return OpenAIProvider(self.openai_api_key, model or self.model)
         elif provider_type == 'bedrock':
             return BedrockProvider(self.bedrock_region, self.bedrock_model_id)
         else:
-            raise ValueError(f"Unsupported judge provider: {provider_type}")
+            raise ValueError(f"Unsupported {role}: {provider_type}")
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+import logging
+
+from typing import Dict, List, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+class ContextBuilder:
+    """Token-budgeted RAG context assembly from retrieved graph interactions."""
+
+    def __init__(self, token_budget: int = 512, snippet_chars: int = 300, warning_threshold: float = 7,
+                 chars_per_token: int = 4, cache_size: int = 1024) -> None:
+        self.char_budget = token_budget * chars_per_token
+        self.snippet_chars = snippet_chars
+        self.warning_threshold = warning_threshold
+        self.cache_size = cache_size
+        # Condensed (prompt, response) per node, keyed by (graph, node_id, timestamp): node ids repeat across
+        # graphs (shards, warnings) and a reused id must never hit stale text
+        self._snippets: "OrderedDict[Tuple[str, int, str], Tuple[str, str]]" = OrderedDict()
+
+    @staticmethod
+    def condense(text: str, limit: int) -> str:
+        """Collapse whitespace and truncate text to at most `limit` characters, preferring sentence boundaries."""
+        text = " ".join(text.split())
+        if len(text) <= limit:
+            return text
+        cut = text[:max(0, limit - 3)]
+        boundary = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "))
+        if boundary >= len(cut) // 2:
+            cut = cut[:boundary + 1]
+        elif cut.rfind(" ") >= len(cut) // 2:
+            cut = cut[:cut.rfind(" ")]
+        return cut.rstrip(".") + "..."
+
+    def _snippet(self, item: Dict) -> Tuple[str, str]:
+        """Return the cached condensed prompt/response pair for a retrieved node."""
+        key = (item.get('graph', ''), item['node_id'], item.get('timestamp', ''))
+        if key in self._snippets:
+            self._snippets.move_to_end(key)
+            return self._snippets[key]
+        snippet = (self.condense(item['prompt'], self.snippet_chars // 3),
+                   self.condense(item['response'], self.snippet_chars))
+        self._snippets[key] = snippet
+        if len(self._snippets) > self.cache_size:
+            self._snippets.popitem(last=False)
+        return snippet
+
+    def build(self, relevant: List[Dict], header: str = "Relevant past interactions for reference:") -> str:
+        """Assemble context from retrieved interactions within the character budget, high-regret warnings first."""
+        if not relevant:
+            return ""
+        warnings = sorted((r for r in relevant if r['overall_regret'] >= self.warning_threshold),
+                          key=lambda r: r['overall_regret'], reverse=True)
+        others = [r for r in relevant if r['overall_regret'] < self.warning_threshold]
+
+        parts = [header]
+        used = len(header)
+        for r in warnings + others:
+            past_prompt, past_response = self._snippet(r)
+            label = "Warning (high regret) past prompt" if r['overall_regret'] >= self.warning_threshold else "Past prompt"
+            entry = (f"{label}: {past_prompt}\nPast response: {past_response}\n"
+                     f"Judgment: {r['judgment']}\nRegret: {r['overall_regret']:.1f}\n")
+            if used + len(entry) + 1 > self.char_budget:
+                continue
+            parts.append(entry)
+            used += len(entry) + 1
+        if len(parts) == 1:
+            logger.debug("No retrieved interaction fits the context budget")
+            return ""
+        return "\n".join(parts)
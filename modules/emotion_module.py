@@ -1,9 +1,44 @@
-from typing import Literal
-from transformers import pipeline
+import logging
+import time
 
+from typing import Any, Callable, Literal
 
-# Load sentiment analysis pipeline
-sentiment_analyzer = pipeline("sentiment-analysis", model="cardiffnlp/twitter-roberta-base-sentiment-latest")
+from .metrics_module import time_stage
+
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_MODEL = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+LOAD_RETRY_SECONDS = 300.0
+
+# Sentiment analysis pipeline, loaded on first use (or replaced via set_sentiment_analyzer)
+sentiment_analyzer = None
+_load_error = None
+_load_failed_at = 0.0
+
+
+def get_sentiment_analyzer() -> Callable[[str], Any]:
+    """Return the sentiment analysis pipeline, loading the model on first call."""
+    global sentiment_analyzer, _load_error, _load_failed_at
+    if sentiment_analyzer is None:
+        if _load_error is not None and time.monotonic() - _load_failed_at < LOAD_RETRY_SECONDS:
+            raise RuntimeError(f"Sentiment model unavailable: {_load_error}")
+        try:
+            from transformers import pipeline
+            sentiment_analyzer = pipeline("sentiment-analysis", model=SENTIMENT_MODEL)
+        except Exception as e:
+            # Remember the failure so every call doesn't retry the download; try again after LOAD_RETRY_SECONDS
+            logger.error(f"Loading sentiment model failed: {e}")
+            _load_error, _load_failed_at = e, time.monotonic()
+            raise
+        _load_error = None
+    return sentiment_analyzer
+
+
+def set_sentiment_analyzer(analyzer: Callable[[str], Any]) -> None:
+    """Replace the sentiment analyzer, e.g. with a stub for tests and benchmarks."""
+    global sentiment_analyzer
+    sentiment_analyzer = analyzer
 
 
 def update_emotion(judgment: str, regret: int, factual_accuracy: int = 5, emotional_impact: int = 5, response_text: str = "") -> Literal["angry", "sad", "happy", "neutral", "anxious", "confident"]:
@@ -12,7 +47,8 @@ def update_emotion(judgment: str, regret: int, factual_accuracy: int = 5, emotio
     sentiment_score = 0.5  # Neutral default
     if response_text:
         try:
-            result = sentiment_analyzer(response_text[:512])  # Limit length
+            with time_stage('sentiment'):
+                result = get_sentiment_analyzer()(response_text[:512])  # Limit length
             label = result[0]['label']
             if label == 'LABEL_2':  # Positive
                 sentiment_score = 0.8
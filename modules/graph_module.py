@@ -1,34 +1,118 @@
 import networkx as nx
 import pickle
-import matplotlib.pyplot as plt
-from networkx.algorithms.community import greedy_modularity_communities
-from networkx.algorithms.centrality import betweenness_centrality
 from datetime import datetime
 import logging
 
-from typing import Optional, Any, Dict, List
+from typing import Optional, Any, Dict, List, Tuple
+
+from .analytics_module import RegretRollups
+from .metrics_module import timed
 
 
 logger = logging.getLogger(__name__)
 
+# scikit-learn and numpy are imported on first retrieval; matplotlib only when visualizing
+_similarity_backend: Optional[Tuple[Any, Any, Any]] = None
+
+
+def similarity_backend() -> Tuple[Any, Any, Any]:
+    """Return (TfidfVectorizer, cosine_similarity, numpy), importing them once."""
+    global _similarity_backend
+    if _similarity_backend is None:
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.metrics.pairwise import cosine_similarity
+        import numpy as np
+        _similarity_backend = (TfidfVectorizer, cosine_similarity, np)
+    return _similarity_backend
+
+
+def overall_regret(scores: Dict[str, float]) -> float:
+    """Compute overall regret: average of ethical + (10 - factual) + (10 - emotional)."""
+    return (scores['ethical_regret'] + (10 - scores['factual_accuracy']) + (10 - scores['emotional_impact'])) / 3
+
+
+def node_attributes(record: Dict[str, Any], default_timestamp: str,
+                    judge_model: Optional[str] = None) -> Dict[str, Any]:
+    """Stored node attributes for an interaction record (extra record keys are not persisted).
+
+    `judge_model` names the judge that scored the record, so re-judging can skip it later.
+    """
+    attrs = {'prompt': record['prompt'], 'response': record['response'], 'judgment': record['judgment'],
+             'regret_scores': record['regret_scores'], 'emotion': record['emotion'],
+             'timestamp': record.get('timestamp') or default_timestamp}
+    judge_model = record.get('judge_model') or judge_model
+    if judge_model:
+        attrs['judge_model'] = judge_model
+    return attrs
+
 
 class KnowledgeGraph:
     """Directed knowledge graph for storing prompts, responses, judgments, regrets, and emotions."""
-    def __init__(self) -> None:
-        self.graph: nx.DiGraph = nx.DiGraph()
-
+    def __init__(self, name: str = 'global') -> None:
+        self.name = name  # graph identity (e.g. a shard id), carried on retrieval results
+        self.rollups = RegretRollups()
+        self.graph = nx.DiGraph()
+
+    @property
+    def graph(self) -> nx.DiGraph:
+        return self._graph
+
+    @graph.setter
+    def graph(self, value: nx.DiGraph) -> None:
+        """Replace the whole graph (e.g. on load), rebuilding the analytics rollups from it."""
+        self._graph = value
+        self.rollups.rebuild(data for _, data in value.nodes(data=True))
+
+    @timed('graph_mutation')
     def add(self, prompt: str, response: str, judgment: str, regret_scores: Dict[str, int], emotion: str,
-            timestamp: Optional[str] = None) -> int:
-        """Add a new node to the graph."""
-        node_id = len(self.graph.nodes) + 1
+            timestamp: Optional[str] = None, **attrs: Any) -> int:
+        """Add a new node to the graph; extra keyword attributes (e.g. judge_model) are stored on the node."""
+        node_id = self._next_id()
         self.graph.add_node(node_id, prompt=prompt, response=response, judgment=judgment,
                             regret_scores=regret_scores, emotion=emotion,
-                            timestamp=timestamp or datetime.now().isoformat())
-        if node_id > 1:
+                            timestamp=timestamp or datetime.now().isoformat(), **attrs)
+        if node_id > 1 and node_id - 1 in self.graph:
             self.graph.add_edge(node_id-1, node_id)
+        self.rollups.add(self.graph.nodes[node_id])
         logger.info(f"Added node {node_id} with regret scores {regret_scores}")
         return node_id
 
+    @timed('graph_mutation')
+    def add_many(self, records: List[Dict[str, Any]], judge_model: Optional[str] = None) -> List[int]:
+        """Add several interactions in one bulk commit, chained in order after the latest node."""
+        start = self._next_id()
+        now = datetime.now().isoformat()
+        node_ids = list(range(start, start + len(records)))
+        attrs = [node_attributes(r, now, judge_model) for r in records]
+        self.graph.add_nodes_from(zip(node_ids, attrs))
+        self.rollups.add_many(attrs)
+        chain = ([start - 1] if start - 1 in self.graph else []) + node_ids
+        self.graph.add_edges_from(zip(chain, chain[1:]))
+        logger.info(f"Bulk added {len(node_ids)} nodes")
+        return node_ids
+
+    @timed('graph_mutation')
+    def update_node(self, node_id: int, **attrs: Any) -> None:
+        """Atomically replace attributes of an existing node."""
+        if node_id not in self.graph:
+            raise KeyError(f"Node {node_id} not found")
+        data = self.graph.nodes[node_id]
+        old = dict(data)
+        data.update(attrs)
+        self.rollups.update(old, data)
+
+    @timed('graph_mutation')
+    def remove_nodes(self, node_ids: List[int]) -> None:
+        """Remove nodes and their edges from the graph."""
+        for node_id in node_ids:
+            if node_id in self.graph:
+                self.rollups.remove(self.graph.nodes[node_id])
+        self.graph.remove_nodes_from(node_ids)
+
+    def _next_id(self) -> int:
+        """Next free node id; derived from the highest id so ids stay unique after pruning."""
+        return max(self.graph.nodes, default=0) + 1
+
     def save(self, path: str = 'graphs/graph.pkl') -> None:
         """Save the graph to disk."""
         with open(path, 'wb') as f:
@@ -43,45 +127,35 @@ class KnowledgeGraph:
         except Exception:
             return False
 
-    def visualize(self, out_path: str = 'graphs/graph.png') -> None:
-        """Save a visualization of the graph as a PNG image."""
-        plt.figure(figsize=(10, 8))
-        pos = nx.spring_layout(self.graph)
-        node_colors = []
-        for n in self.graph.nodes:
-            scores = self.graph.nodes[n].get('regret_scores',
-                                             {'ethical_regret': 5, 'factual_accuracy': 5, 'emotional_impact': 5})
-            overall = (scores['ethical_regret'] + (10 - scores['factual_accuracy']) +
-                       (10 - scores['emotional_impact'])) / 3
-            node_colors.append('red' if overall > 7 else 'lightblue')
-        labels = {n: self.graph.nodes[n]['prompt'][:20] +
-                  ('...' if len(self.graph.nodes[n]['prompt']) > 20 else '')
-                  for n in self.graph.nodes}
-        nx.draw(self.graph, pos, labels=labels, node_color=node_colors, font_size=8, node_size=500)
-        plt.title("RegretGraph Knowledge Graph (Red: High Regret)")
-        plt.savefig(out_path)
+    def visualize(self, out_path: str = 'graphs/graph.png', view: str = 'nodes', max_nodes: int = 500) -> None:
+        """Save a visualization of the graph as a PNG image (sampled or aggregated; see visualization_module)."""
+        from .visualization_module import GraphRenderer
+        GraphRenderer(max_nodes).render(self.graph, view, out_path=out_path)
 
     def analyze_clusters(self) -> Any:
         """Analyze graph clusters using modularity communities."""
         if len(self.graph.nodes) < 2:
             return "Not enough nodes for clustering."
+        from networkx.algorithms.community import greedy_modularity_communities
         communities = list(greedy_modularity_communities(self.graph))
         num_clusters = len(communities)
         return f"Found {num_clusters} clusters. Sizes: {[len(c) for c in communities]}"
 
+    @timed('forgetting')
     def causal_forgetting(self, regret_threshold: int = 3, age_days_threshold: int = 7, high_regret_threshold: int = 7) -> int:
         """Advanced causal forgetting: Retain high-regret nodes as warnings, prune low-regret nodes that are old and unimportant to contemplate both good and bad examples."""
-        if len(self.graph.nodes) < 2:
+        graph = self.graph  # one snapshot per call; a shared store may refresh between reads
+        if len(graph.nodes) < 2:
             return 0  # Not enough nodes for meaningful forgetting
 
         current_time = datetime.now()
         to_prune = []
 
         # Calculate betweenness centrality for importance
-        centrality = betweenness_centrality(self.graph)
+        centrality = nx.betweenness_centrality(graph)
 
-        for node in list(self.graph.nodes):
-            data = self.graph.nodes[node]
+        for node in list(graph.nodes):
+            data = graph.nodes[node]
             age_days = (current_time - datetime.fromisoformat(data['timestamp'])).days
             regret_scores = data.get('regret_scores', {'ethical_regret': 5, 'factual_accuracy': 5, 'emotional_impact': 5})
             # Compute overall regret: average of ethical + (10 - factual) + (10 - emotional)
@@ -90,24 +164,23 @@ class KnowledgeGraph:
             importance = centrality.get(node, 0)
 
             # Retain high-regret nodes (mistakes) as warnings; prune low-regret nodes only if old and unimportant
-            connectivity = len(list(self.graph.neighbors(node)))
+            connectivity = len(list(graph.neighbors(node)))
             if overall_regret < regret_threshold and age_days > age_days_threshold * 2 and (importance < 0.01 or connectivity < 1):
                 to_prune.append(node)
 
-        for node in to_prune:
-            self.graph.remove_node(node)
+        self.remove_nodes(to_prune)
         logger.info(f"Pruned {len(to_prune)} nodes via causal forgetting")
         return len(to_prune)
+    @timed('retrieval')
     def retrieve_relevant(self, prompt: str, top_k: int = 3) -> List[Dict]:
         """Retrieve top-k relevant past interactions based on prompt similarity and high regret for learning."""
-        from sklearn.feature_extraction.text import TfidfVectorizer
-        from sklearn.metrics.pairwise import cosine_similarity
-        import numpy as np
+        TfidfVectorizer, cosine_similarity, np = similarity_backend()
+        graph = self.graph  # one snapshot per call; a shared store may refresh between reads
 
-        if len(self.graph.nodes) < 1:
+        if len(graph.nodes) < 1:
             return []
 
-        prompts = [self.graph.nodes[n]['prompt'] for n in self.graph.nodes]
+        prompts = [graph.nodes[n]['prompt'] for n in graph.nodes]
         prompts.append(prompt)
         vectorizer = TfidfVectorizer(stop_words='english')
         tfidf_matrix = vectorizer.fit_transform(prompts)
@@ -115,8 +188,8 @@ class KnowledgeGraph:
 
         # Prioritize high-regret nodes for learning from mistakes
         regrets = []
-        for i, n in enumerate(self.graph.nodes):
-            scores = self.graph.nodes[n].get('regret_scores', {'ethical_regret': 5, 'factual_accuracy': 5, 'emotional_impact': 5})
+        for i, n in enumerate(graph.nodes):
+            scores = graph.nodes[n].get('regret_scores', {'ethical_regret': 5, 'factual_accuracy': 5, 'emotional_impact': 5})
             overall_regret = (scores['ethical_regret'] + (10 - scores['factual_accuracy']) + (10 - scores['emotional_impact'])) / 3
             regrets.append(overall_regret)
 
@@ -126,26 +199,29 @@ class KnowledgeGraph:
         top_indices = np.argsort(combined_scores)[-top_k:][::-1]
         relevant = []
         for idx in top_indices:
-            n = list(self.graph.nodes)[idx]
+            n = list(graph.nodes)[idx]
             relevant.append({
+                'graph': self.name,
                 'node_id': n,
-                'prompt': self.graph.nodes[n]['prompt'],
-                'response': self.graph.nodes[n]['response'],
-                'judgment': self.graph.nodes[n]['judgment'],
-                'regret_scores': self.graph.nodes[n]['regret_scores'],
+                'prompt': graph.nodes[n]['prompt'],
+                'response': graph.nodes[n]['response'],
+                'judgment': graph.nodes[n]['judgment'],
+                'regret_scores': graph.nodes[n]['regret_scores'],
+                'timestamp': graph.nodes[n].get('timestamp', ''),
                 'similarity': similarities[idx],
                 'overall_regret': regrets[idx]
             })
         return relevant
 
     def check_past_regrets(self, prompt: str, regret_threshold: int = 7) -> Any:
-        high_regret_nodes = [n for n in self.graph.nodes
-                             if (self.graph.nodes[n].get('regret_scores', {}).get('ethical_regret', 5) +
-                                 (10 - self.graph.nodes[n].get('regret_scores', {}).get('factual_accuracy', 5)) +
-                                 (10 - self.graph.nodes[n].get('regret_scores', {}).get('emotional_impact', 5))) / 3
+        graph = self.graph  # one snapshot per call; a shared store may refresh between reads
+        high_regret_nodes = [n for n in graph.nodes
+                             if (graph.nodes[n].get('regret_scores', {}).get('ethical_regret', 5) +
+                                 (10 - graph.nodes[n].get('regret_scores', {}).get('factual_accuracy', 5)) +
+                                 (10 - graph.nodes[n].get('regret_scores', {}).get('emotional_impact', 5))) / 3
                              > regret_threshold]
         for node in high_regret_nodes:
-            past_prompt = self.graph.nodes[node]['prompt']
+            past_prompt = graph.nodes[node]['prompt']
             past_words = set(w.lower() for w in past_prompt.split() if len(w) > 3)
             prompt_words = set(w.lower() for w in prompt.split() if len(w) > 3)
             if past_words & prompt_words:
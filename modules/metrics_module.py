@@ -0,0 +1,207 @@
+import bisect
+import functools
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    """Base class for labelled metrics rendered in the Prometheus text exposition format."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Sample lines for every label combination."""
+        pass
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Gauge that is either set explicitly or computed by a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def value(self, **labels: str) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {self._function()}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram of observed values (seconds for latencies)."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + [float('inf')], counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics exposed together on the /metrics endpoint."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'regretgraph_http_request_seconds', 'Latency of API requests by route.', ['method', 'route', 'status']))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    'regretgraph_stage_seconds', 'Latency of each prompt pipeline stage.', ['stage']))
+LLM_LATENCY = REGISTRY.register(Histogram(
+    'regretgraph_llm_request_seconds', 'Latency of LLM provider calls.', ['provider', 'model']))
+LLM_ERRORS = REGISTRY.register(Counter(
+    'regretgraph_llm_errors_total', 'Failed LLM provider calls.', ['provider', 'model']))
+LLM_HEDGES = REGISTRY.register(Counter(
+    'regretgraph_llm_hedged_requests_total', 'Hedged duplicate LLM requests sent.', ['provider']))
+CIRCUIT_OPENED = REGISTRY.register(Counter(
+    'regretgraph_llm_circuit_opened_total', 'Times a provider circuit breaker opened.', ['provider']))
+ROUTING_FALLBACKS = REGISTRY.register(Counter(
+    'regretgraph_llm_pressure_fallbacks_total', 'Calls routed to fallback providers first under pressure.'))
+JUDGE_FALLBACKS = REGISTRY.register(Counter(
+    'regretgraph_judge_default_scores_total', 'Judgments that fell back to default scores.'))
+JUDGE_PARSES = REGISTRY.register(Counter(
+    'regretgraph_judge_parses_total', 'Judge verdicts by parse path (json, regex or failed).', ['method']))
+BACKGROUND_FAILURES = REGISTRY.register(Counter(
+    'regretgraph_background_task_failures_total', 'Background tasks that raised an exception.', ['task']))
+GRAPH_NODES = REGISTRY.register(Gauge(
+    'regretgraph_graph_nodes', 'Number of nodes in the knowledge graph.'))
+BACKGROUND_BACKLOG = REGISTRY.register(Gauge(
+    'regretgraph_background_tasks', 'Background tasks currently pending.'))
+SHARDS_LOADED = REGISTRY.register(Gauge(
+    'regretgraph_shards_loaded', 'Session graph shards currently held in memory.'))
+SHARD_EVICTIONS = REGISTRY.register(Counter(
+    'regretgraph_shard_evictions_total', 'Session graph shards saved and unloaded.'))
+
+
+def time_stage(stage: str):
+    """Context manager timing one pipeline stage into STAGE_LATENCY."""
+    return STAGE_LATENCY.time(stage=stage)
+
+
+def timed(stage: str) -> Callable:
+    """Decorator timing every call of a function as one pipeline stage."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with STAGE_LATENCY.time(stage=stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,88 @@
+import cProfile
+import io
+import itertools
+import marshal
+import pstats
+import random
+import threading
+from collections import deque
+from datetime import datetime
+
+from typing import Any, Dict, List, Optional
+
+
+class SlowTrace:
+    """cProfile capture of one slow (or explicitly profiled) request."""
+
+    def __init__(self, trace_id: int, method: str, path: str, duration_ms: float, profile: cProfile.Profile,
+                 max_rows: int) -> None:
+        self.trace_id = trace_id
+        self.method = method
+        self.path = path
+        self.duration_ms = duration_ms
+        self.timestamp = datetime.now().isoformat()
+        profile.create_stats()
+        self.profile_data = marshal.dumps(profile.stats)
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(max_rows)
+        self.report = out.getvalue()
+
+    def summary(self) -> Dict[str, Any]:
+        return {'id': self.trace_id, 'method': self.method, 'path': self.path,
+                'duration_ms': round(self.duration_ms, 1), 'timestamp': self.timestamp}
+
+
+class RequestProfiler:
+    """Opt-in per-request cProfile sampling that keeps the last N slow traces in a ring buffer.
+
+    cProfile only sees the event-loop thread, so a trace also includes other coroutines that ran while
+    the request was in flight; work offloaded with asyncio.to_thread is not captured. Only one request is
+    profiled at a time because the interpreter allows a single active profiler.
+    """
+
+    def __init__(self, enabled: bool = False, sample_rate: float = 0.0, slow_threshold_ms: float = 1000,
+                 ring_size: int = 20, max_rows: int = 40) -> None:
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_threshold_ms = slow_threshold_ms
+        self.max_rows = max_rows
+        self._traces: "deque[SlowTrace]" = deque(maxlen=ring_size)
+        self._ids = itertools.count(1)
+        self._active = threading.Lock()
+
+    def start(self, requested: bool = False) -> Optional[cProfile.Profile]:
+        """Begin profiling the current request if enabled and selected, else return None."""
+        if not self.enabled or not (requested or random.random() < self.sample_rate):
+            return None
+        if not self._active.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger or coverage tool) is already active
+            self._active.release()
+            return None
+        return profile
+
+    def finish(self, profile: cProfile.Profile, method: str, path: str, duration_s: float,
+               requested: bool = False) -> Optional[SlowTrace]:
+        """Stop profiling; keep the trace if the request was slow or explicitly profiled."""
+        profile.disable()
+        self._active.release()
+        duration_ms = duration_s * 1000
+        if not requested and duration_ms < self.slow_threshold_ms:
+            return None
+        trace = SlowTrace(next(self._ids), method, path, duration_ms, profile, self.max_rows)
+        self._traces.append(trace)
+        return trace
+
+    def traces(self) -> List[Dict[str, Any]]:
+        """Summaries of retained traces, newest first."""
+        return [t.summary() for t in reversed(self._traces)]
+
+    def get(self, trace_id: int) -> Optional[SlowTrace]:
+        for trace in self._traces:
+            if trace.trace_id == trace_id:
+                return trace
+        return None
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from .emotion_module import update_emotion
+from .graph_module import KnowledgeGraph, overall_regret
+from .shard_module import ShardManager
+
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_GRAPH = 'global'
+
+
+class RejudgeJob:
+    """Resumable background job that re-scores stored nodes with the current judge model.
+
+    The global graph is walked first, then every session shard, each with its own checkpoint cursor.
+    """
+
+    def __init__(self, llm: Any, graph: KnowledgeGraph, judge_model: str,
+                 checkpoint_path: str = 'graphs/rejudge_checkpoint.json',
+                 chunk_size: int = 20, concurrency: int = 4, shards: Optional[ShardManager] = None) -> None:
+        self.llm = llm
+        self.graph = graph
+        self.shards = shards
+        self.judge_model = judge_model
+        self.checkpoint_path = checkpoint_path
+        self.chunk_size = max(1, chunk_size)
+        self.concurrency = max(1, concurrency)
+        self.state = 'idle'
+        self.error: Optional[str] = None
+        self.cursors: Dict[str, int] = {}  # graph id -> last processed node id
+        self.current_graph: Optional[str] = None
+        self.processed = 0
+        self.updated = 0
+        self.total = 0
+        self.started_at: Optional[float] = None
+        self._processed_at_start = 0
+
+    def load_checkpoint(self) -> None:
+        """Resume from the checkpoint if it was written for the same judge model."""
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return
+        if checkpoint.get('judge_model') != self.judge_model:
+            logger.info("Rejudge checkpoint belongs to a different judge model, starting over")
+            return
+        # Checkpoints from before sharding only carry the global graph's cursor
+        self.cursors = checkpoint.get('cursors') or {GLOBAL_GRAPH: checkpoint.get('last_node_id', 0)}
+        self.processed = checkpoint.get('processed', 0)
+        self.updated = checkpoint.get('updated', 0)
+
+    def _save_checkpoint(self) -> None:
+        """Write the checkpoint atomically so a crash never leaves a partial file."""
+        checkpoint = {'judge_model': self.judge_model, 'cursors': self.cursors,
+                      'processed': self.processed, 'updated': self.updated, 'state': self.state}
+        os.makedirs(os.path.dirname(self.checkpoint_path) or '.', exist_ok=True)
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _graph_ids(self) -> List[str]:
+        return [GLOBAL_GRAPH] + (self.shards.shard_ids() if self.shards is not None else [])
+
+    def _resolve(self, graph_id: str) -> KnowledgeGraph:
+        # Shards are looked up per use: one may be evicted and reloaded while a chunk is judged
+        return self.graph if graph_id == GLOBAL_GRAPH else self.shards.get(graph_id)
+
+    async def _judge_node(self, kg: KnowledgeGraph, node_id: int,
+                          semaphore: asyncio.Semaphore) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Judge one node and compute its new attributes without mutating the graph."""
+        async with semaphore:
+            data = kg.graph.nodes.get(node_id)
+            if data is None or data.get('judge_model') == self.judge_model:
+                return node_id, None
+            prompt, response = data['prompt'], data['response']
+            try:
+                judgment, scores, explanation, hot_thought = await self.llm.judge_response_async(prompt, response)
+                regret = overall_regret(scores)
+                emotion = await asyncio.to_thread(update_emotion, judgment, int(regret), scores['factual_accuracy'],
+                                                  scores['emotional_impact'], response)
+            except Exception as e:
+                logger.error(f"Re-judging node {node_id} failed: {e}")
+                return node_id, None
+            return node_id, {'judgment': judgment, 'regret_scores': scores, 'emotion': emotion,
+                             'judge_model': self.judge_model}
+
+    async def run(self) -> None:
+        """Walk stored nodes in id order and chunks, checkpointing after each chunk."""
+        self.state = 'running'
+        self.error = None
+        self.load_checkpoint()
+        pending: Dict[str, List[int]] = {
+            graph_id: sorted(n for n in self._resolve(graph_id).graph.nodes if n > self.cursors.get(graph_id, 0))
+            for graph_id in self._graph_ids()}
+        self.total = self.processed + sum(len(node_ids) for node_ids in pending.values())
+        self._processed_at_start = self.processed
+        self.started_at = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            for graph_id, node_ids in pending.items():
+                self.current_graph = graph_id
+                for i in range(0, len(node_ids), self.chunk_size):
+                    chunk = node_ids[i:i + self.chunk_size]
+                    kg = self._resolve(graph_id)
+                    results = await asyncio.gather(*(self._judge_node(kg, n, semaphore) for n in chunk))
+                    kg = self._resolve(graph_id)
+                    updated = []
+                    for node_id, attrs in results:
+                        # Nodes may have been pruned while the chunk was being judged
+                        if attrs is not None and node_id in kg.graph:
+                            kg.update_node(node_id, **attrs)
+                            updated.append(node_id)
+                    if updated and graph_id != GLOBAL_GRAPH:
+                        self.shards.sync_warnings(graph_id, updated)
+                    self.updated += len(updated)
+                    self.cursors[graph_id] = chunk[-1]
+                    self.processed += len(chunk)
+                    self._save_checkpoint()
+            self.state = 'completed'
+        except asyncio.CancelledError:
+            self.state = 'cancelled'
+            raise
+        except Exception as e:
+            logger.error(f"Rejudge job failed: {e}")
+            self.state = 'failed'
+            self.error = str(e)
+        finally:
+            self._save_checkpoint()
+        logger.info(f"Rejudge job {self.state}: {self.updated} nodes updated")
+
+    def status(self) -> Dict[str, Any]:
+        """Progress snapshot with rate (nodes/s) and ETA in seconds."""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        done_this_run = self.processed - self._processed_at_start
+        rate = done_this_run / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - self.processed)
+        return {
+            'state': self.state,
+            'judge_model': self.judge_model,
+            'processed': self.processed,
+            'updated': self.updated,
+            'total': self.total,
+            'remaining': remaining,
+            'current_graph': self.current_graph,
+            'last_node_id': self.cursors.get(self.current_graph, 0) if self.current_graph else 0,
+            'rate_per_second': round(rate, 3),
+            'eta_seconds': round(remaining / rate, 1) if rate > 0 else None,
+            'error': self.error,
+        }
@@ -0,0 +1,139 @@
+from collections import OrderedDict
+import logging
+import os
+import re
+import threading
+import time
+
+from typing import Dict, List, Tuple
+
+from .graph_module import KnowledgeGraph, overall_regret
+from .metrics_module import SHARD_EVICTIONS
+
+
+logger = logging.getLogger(__name__)
+
+SHARD_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+WARNINGS_SHARD = '_warnings'
+
+
+class ShardManager:
+    """Per-session/tenant knowledge graphs kept in an LRU of in-memory shards backed by pickle files.
+
+    Shards are loaded from `shard_dir` on first use and saved back when evicted, either because more
+    than `max_shards` are loaded or because one has been idle for `idle_seconds`. High-regret nodes
+    from every shard are mirrored into a global warnings graph so retrieval can surface other
+    sessions' mistakes without scanning their histories.
+    """
+
+    def __init__(self, shard_dir: str = 'graphs/shards', max_shards: int = 64, idle_seconds: float = 900,
+                 warning_threshold: float = 7, cross_shard_warnings: bool = True) -> None:
+        self.shard_dir = shard_dir
+        self.max_shards = max_shards
+        self.idle_seconds = idle_seconds
+        self.warning_threshold = warning_threshold
+        self.cross_shard_warnings = cross_shard_warnings
+        self._shards: "OrderedDict[str, Tuple[KnowledgeGraph, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.warnings = KnowledgeGraph(WARNINGS_SHARD)
+        self.warnings.load(self._path(WARNINGS_SHARD))
+        self._warnings_dirty = False
+        # (shard_id, node_id) -> node id in the warnings graph
+        self._warning_index: Dict[Tuple[str, int], int] = {
+            (data['shard_id'], data['source_node']): n for n, data in self.warnings.graph.nodes(data=True)}
+
+    def _path(self, shard_id: str) -> str:
+        return os.path.join(self.shard_dir, f"{shard_id}.pkl")
+
+    def _save(self, shard_id: str, shard: KnowledgeGraph) -> None:
+        os.makedirs(self.shard_dir, exist_ok=True)
+        shard.save(self._path(shard_id))
+
+    def get(self, shard_id: str) -> KnowledgeGraph:
+        """Return the shard for `shard_id`, loading it from disk or creating it as needed."""
+        if not SHARD_ID_PATTERN.match(shard_id) or shard_id == WARNINGS_SHARD:
+            raise ValueError(f"Invalid session id: {shard_id!r}")
+        with self._lock:
+            now = time.monotonic()
+            if shard_id in self._shards:
+                shard = self._shards.pop(shard_id)[0]
+            else:
+                shard = KnowledgeGraph(shard_id)
+                shard.load(self._path(shard_id))
+            self._shards[shard_id] = (shard, now)
+            self._evict(now)
+            return shard
+
+    def _evict(self, now: float, flush_warnings: bool = False) -> None:
+        # The OrderedDict is in last-use order, so idle and over-capacity shards are at the front
+        evicted = False
+        while self._shards:
+            shard_id, (shard, last_used) = next(iter(self._shards.items()))
+            if len(self._shards) <= self.max_shards and now - last_used < self.idle_seconds:
+                break
+            del self._shards[shard_id]
+            self._save(shard_id, shard)
+            evicted = True
+            SHARD_EVICTIONS.inc()
+            logger.info(f"Evicted shard {shard_id}")
+        # Persist the warnings mirror alongside evictions so a crash doesn't lose it
+        if (evicted or flush_warnings) and self._warnings_dirty:
+            self._save_warnings()
+
+    def _save_warnings(self) -> None:
+        self._save(WARNINGS_SHARD, self.warnings)
+        self._warnings_dirty = False
+
+    def evict_idle(self) -> None:
+        """Save and unload shards idle for longer than `idle_seconds`, and save changed warnings."""
+        with self._lock:
+            self._evict(time.monotonic(), flush_warnings=True)
+
+    def shard_ids(self) -> List[str]:
+        """Ids of every shard, saved or only in memory so far, in sorted order."""
+        with self._lock:
+            ids = set(self._shards)
+            if os.path.isdir(self.shard_dir):
+                ids.update(name[:-len('.pkl')] for name in os.listdir(self.shard_dir) if name.endswith('.pkl'))
+        return sorted(i for i in ids if i != WARNINGS_SHARD and SHARD_ID_PATTERN.match(i))
+
+    def loaded(self) -> List[str]:
+        """Ids of shards currently in memory, least recently used first."""
+        with self._lock:
+            return list(self._shards)
+
+    def save_all(self) -> None:
+        """Persist every loaded shard and the warnings graph."""
+        with self._lock:
+            for shard_id, (shard, _) in self._shards.items():
+                self._save(shard_id, shard)
+            if self._warnings_dirty:
+                self._save_warnings()
+
+    def sync_warnings(self, shard_id: str, node_ids: List[int]) -> None:
+        """Mirror, refresh or drop the global warning copies of these shard nodes after they change."""
+        shard = self.get(shard_id)
+        with self._lock:
+            for node_id in node_ids:
+                key = (shard_id, node_id)
+                data = shard.graph.nodes[node_id] if node_id in shard.graph else None
+                high = data is not None and overall_regret(data['regret_scores']) > self.warning_threshold
+                self._warnings_dirty = self._warnings_dirty or high or key in self._warning_index
+                if key in self._warning_index and not high:
+                    self.warnings.remove_nodes([self._warning_index.pop(key)])
+                elif key in self._warning_index:
+                    self.warnings.update_node(self._warning_index[key], **data)
+                elif high:
+                    self._warning_index[key] = self.warnings.add(**data, shard_id=shard_id, source_node=node_id)
+
+    def retrieve_relevant(self, shard_id: str, prompt: str, top_k: int = 3) -> List[Dict]:
+        """Top-k interactions from the session's own shard, merged with other sessions' high-regret warnings."""
+        relevant = self.get(shard_id).retrieve_relevant(prompt, top_k=top_k)
+        if not self.cross_shard_warnings:
+            return relevant
+        with self._lock:
+            warnings = [w for w in self.warnings.retrieve_relevant(prompt, top_k=top_k)
+                        if self.warnings.graph.nodes[w['node_id']]['shard_id'] != shard_id]
+        # Same ranking as KnowledgeGraph.retrieve_relevant: similarity plus a regret boost
+        merged = sorted(relevant + warnings, key=lambda r: r['similarity'] + r['overall_regret'] * 0.5, reverse=True)
+        return merged[:top_k]
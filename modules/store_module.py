@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import networkx as nx
+
+from typing import Any, Dict, List, Optional
+
+from .analytics_module import RegretRollups
+from .graph_module import KnowledgeGraph, node_attributes
+from .metrics_module import timed
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (id INTEGER PRIMARY KEY, data TEXT NOT NULL, version INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS edges (src INTEGER NOT NULL, dst INTEGER NOT NULL, version INTEGER NOT NULL,
+                                  PRIMARY KEY (src, dst));
+CREATE TABLE IF NOT EXISTS tombstones (id INTEGER PRIMARY KEY, version INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS nodes_version ON nodes (version);
+CREATE INDEX IF NOT EXISTS edges_version ON edges (version);
+CREATE INDEX IF NOT EXISTS tombstones_version ON tombstones (version);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0), ('next_id', 1);
+"""
+
+
+class SharedKnowledgeGraph(KnowledgeGraph):
+    """KnowledgeGraph whose source of truth is a SQLite (WAL) file shared by several worker processes.
+
+    Each process keeps an in-memory networkx snapshot for reads. The snapshot is refreshed incrementally
+    (only rows whose version is newer) when SQLite reports another connection has committed, checked at
+    most every `refresh_interval` seconds. Writes run in `BEGIN IMMEDIATE` transactions, so SQLite's
+    write lock makes a single owner of every mutation and node ids stay unique across workers.
+
+    Writes are called from the API's event loop, so SQLite only waits `busy_timeout` seconds for the write
+    lock at a time; between attempts the writer backs off with the local lock released, and gives up with
+    `sqlite3.OperationalError` after `write_timeout` seconds.
+    """
+
+    def __init__(self, path: str = 'graphs/graph.db', refresh_interval: float = 0.05,
+                 busy_timeout: float = 0.05, write_timeout: float = 5.0) -> None:
+        self.path = path
+        self.name = 'global'
+        self.refresh_interval = refresh_interval
+        self.busy_timeout = busy_timeout
+        self.write_timeout = write_timeout
+        self._graph: nx.DiGraph = nx.DiGraph()
+        self.rollups = RegretRollups()
+        self._version = 0
+        self._data_version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Workers starting together may race on the schema, so setup waits as long as it needs
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout * 1000)}")
+        self.refresh(force=True)
+
+    @property
+    def graph(self) -> nx.DiGraph:
+        """Current snapshot, refreshed from the store when it may be stale."""
+        if time.monotonic() - self._checked_at >= self.refresh_interval:
+            self.refresh()
+        return self._graph
+
+    @graph.setter
+    def graph(self, value: nx.DiGraph) -> None:
+        self._graph = value
+        self.rollups.rebuild(data for _, data in value.nodes(data=True))
+
+    def refresh(self, force: bool = False) -> None:
+        """Apply changes committed by other workers since the last refresh."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if not force and data_version == self._data_version:
+                return
+            self._data_version = data_version
+            self._pull()
+
+    def _pull(self) -> None:
+        # One read transaction so nodes, edges and tombstones come from the same snapshot
+        self._conn.execute("BEGIN")
+        try:
+            version = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+            if version == self._version:
+                return
+            nodes = self._conn.execute("SELECT id, data FROM nodes WHERE version > ?", (self._version,)).fetchall()
+            removed = self._conn.execute("SELECT id FROM tombstones WHERE version > ?", (self._version,)).fetchall()
+            edges = self._conn.execute("SELECT src, dst FROM edges WHERE version > ?", (self._version,)).fetchall()
+        finally:
+            self._conn.execute("COMMIT")
+        for node_id, data in nodes:
+            attrs = json.loads(data)
+            if node_id in self._graph:
+                old = dict(self._graph.nodes[node_id])
+                self._graph.nodes[node_id].clear()
+                self._graph.add_node(node_id, **attrs)
+                self.rollups.update(old, attrs)
+            else:
+                self._graph.add_node(node_id, **attrs)
+                self.rollups.add(attrs)
+        for (node_id,) in removed:
+            if node_id in self._graph:
+                self.rollups.remove(self._graph.nodes[node_id])
+                self._graph.remove_node(node_id)
+        self._graph.add_edges_from((src, dst) for src, dst in edges if src in self._graph and dst in self._graph)
+        self._version = version
+
+    def _begin_write(self) -> bool:
+        """Start a write transaction; False if another worker held the write lock past `busy_timeout`."""
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+            return True
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            return False
+
+    def _write(self, apply) -> Any:
+        """Run `apply(conn, version)` in an exclusive write transaction, then pull the result locally."""
+        deadline = time.monotonic() + self.write_timeout
+        delay = self.busy_timeout
+        while True:
+            with self._lock:
+                if self._begin_write():
+                    return self._apply_write(apply)
+            if time.monotonic() + delay > deadline:
+                raise sqlite3.OperationalError(f"Graph store write lock busy for {self.write_timeout}s")
+            # Back off without holding the local lock; waits stay short, so other requests keep being served
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+    def _apply_write(self, apply) -> Any:
+        # Caller holds self._lock and has begun the write transaction
+        try:
+            version = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0] + 1
+            result = apply(self._conn, version)
+            self._conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (version,))
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._pull()
+        return result
+
+    def _insert(self, nodes: List[Dict[str, Any]]) -> List[int]:
+        def apply(conn: sqlite3.Connection, version: int) -> List[int]:
+            start = conn.execute("SELECT value FROM meta WHERE key = 'next_id'").fetchone()[0]
+            last = conn.execute("SELECT MAX(id) FROM nodes").fetchone()[0]
+            node_ids = list(range(start, start + len(nodes)))
+            conn.executemany("INSERT INTO nodes (id, data, version) VALUES (?, ?, ?)",
+                             [(n, json.dumps(data), version) for n, data in zip(node_ids, nodes)])
+            chain = ([last] if last is not None else []) + node_ids
+            conn.executemany("INSERT OR IGNORE INTO edges (src, dst, version) VALUES (?, ?, ?)",
+                             [(src, dst, version) for src, dst in zip(chain, chain[1:])])
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'next_id'", (start + len(nodes),))
+            return node_ids
+        return self._write(apply)
+
+    @timed('graph_mutation')
+    def add(self, prompt: str, response: str, judgment: str, regret_scores: Dict[str, int], emotion: str,
+            timestamp: Optional[str] = None, **attrs: Any) -> int:
+        record = {'prompt': prompt, 'response': response, 'judgment': judgment,
+                  'regret_scores': regret_scores, 'emotion': emotion, 'timestamp': timestamp}
+        node_id = self._insert([{**node_attributes(record, datetime.now().isoformat()), **attrs}])[0]
+        logger.info(f"Added node {node_id} with regret scores {regret_scores}")
+        return node_id
+
+    @timed('graph_mutation')
+    def add_many(self, records: List[Dict[str, Any]], judge_model: Optional[str] = None) -> List[int]:
+        now = datetime.now().isoformat()
+        node_ids = self._insert([node_attributes(r, now, judge_model) for r in records])
+        logger.info(f"Bulk added {len(node_ids)} nodes")
+        return node_ids
+
+    @timed('graph_mutation')
+    def update_node(self, node_id: int, **attrs: Any) -> None:
+        def apply(conn: sqlite3.Connection, version: int) -> None:
+            row = conn.execute("SELECT data FROM nodes WHERE id = ?", (node_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"Node {node_id} not found")
+            # Merge against the stored row, not the local snapshot, so concurrent updates aren't lost
+            data = {**json.loads(row[0]), **attrs}
+            conn.execute("UPDATE nodes SET data = ?, version = ? WHERE id = ?", (json.dumps(data), version, node_id))
+        self._write(apply)
+
+    @timed('graph_mutation')
+    def remove_nodes(self, node_ids: List[int]) -> None:
+        def apply(conn: sqlite3.Connection, version: int) -> None:
+            rows = [(n,) for n in node_ids]
+            conn.executemany("DELETE FROM nodes WHERE id = ?", rows)
+            conn.executemany("DELETE FROM edges WHERE src = ? OR dst = ?", [(n, n) for n in node_ids])
+            conn.executemany("INSERT OR REPLACE INTO tombstones (id, version) VALUES (?, ?)",
+                             [(n, version) for n in node_ids])
+        if node_ids:
+            self._write(apply)
+
+    def load(self, path: str = 'graphs/graph.pkl') -> bool:
+        """Import a pickled graph into an empty store (node ids are renumbered in their original order)."""
+        legacy = KnowledgeGraph()
+        if not legacy.load(path):
+            return False
+        if len(self.graph):
+            logger.warning("Shared graph store is not empty; skipping pickle import")
+            return False
+        self._insert([dict(legacy.graph.nodes[n]) for n in sorted(legacy.graph.nodes)])
+        return True
+
+    def close(self) -> None:
+        self._conn.close()
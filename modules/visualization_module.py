@@ -0,0 +1,226 @@
+from collections import OrderedDict
+from datetime import datetime
+import io
+import itertools
+import logging
+import threading
+import uuid
+
+import networkx as nx
+
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from .graph_module import overall_regret
+from .metrics_module import time_stage
+
+
+logger = logging.getLogger(__name__)
+
+VIEWS = ('nodes', 'cluster', 'time', 'regret')
+TIME_BUCKETS = {'hour': 13, 'day': 10, 'month': 7}  # ISO timestamp prefix length per bucket
+REGRET_BANDS = ((4, 'low'), (7, 'medium'), (float('inf'), 'high'))
+MAX_GROUPS = 50  # aggregated views fold smaller groups beyond this into 'other'
+DEFAULT_SCORES = {'ethical_regret': 5, 'factual_accuracy': 5, 'emotional_impact': 5}
+
+
+def node_regret(data: Dict[str, Any]) -> float:
+    return overall_regret(data.get('regret_scores', DEFAULT_SCORES))
+
+
+def regret_band(regret: float) -> str:
+    return next(label for upper, label in REGRET_BANDS if regret < upper)
+
+
+def sample_nodes(graph: nx.DiGraph, max_nodes: int) -> nx.DiGraph:
+    """Induced subgraph of at most `max_nodes` nodes: the highest-regret half, then the most recent."""
+    if len(graph) <= max_nodes:
+        return graph
+    by_regret = sorted(graph.nodes, key=lambda n: node_regret(graph.nodes[n]), reverse=True)
+    keep = set(by_regret[:max_nodes // 2])
+    by_recency = sorted(graph.nodes, key=lambda n: graph.nodes[n].get('timestamp', ''), reverse=True)
+    keep.update(itertools.islice((n for n in by_recency if n not in keep), max_nodes - len(keep)))
+    return graph.subgraph(keep)
+
+
+def group_nodes(graph: nx.DiGraph, view: str, time_bucket: str = 'day') -> Dict[Hashable, str]:
+    """Map every node to its group label for an aggregated view."""
+    if view == 'cluster':
+        # Louvain scales to large graphs far better than the greedy modularity used by analyze_clusters
+        communities = nx.community.louvain_communities(graph.to_undirected(as_view=True), seed=42)
+        ordered = sorted(communities, key=len, reverse=True)
+        return {n: f"cluster {i + 1}" for i, members in enumerate(ordered) for n in members}
+    if view == 'time':
+        width = TIME_BUCKETS[time_bucket]
+        return {n: data.get('timestamp', '')[:width] or 'unknown' for n, data in graph.nodes(data=True)}
+    if view == 'regret':
+        return {n: f"{regret_band(node_regret(data))} regret" for n, data in graph.nodes(data=True)}
+    raise ValueError(f"Unsupported view: {view}")
+
+
+def aggregate(graph: nx.DiGraph, view: str, time_bucket: str = 'day', max_groups: int = MAX_GROUPS) -> nx.DiGraph:
+    """Collapse the graph into one node per group with its size and mean regret; edges carry counts."""
+    groups = group_nodes(graph, view, time_bucket)
+    sizes: Dict[str, int] = {}
+    for label in groups.values():
+        sizes[label] = sizes.get(label, 0) + 1
+    if len(sizes) > max_groups:
+        kept = set(sorted(sizes, key=sizes.get, reverse=True)[:max_groups - 1])
+        groups = {n: label if label in kept else 'other' for n, label in groups.items()}
+    summary = nx.DiGraph()
+    for n, data in graph.nodes(data=True):
+        label = groups[n]
+        if label not in summary:
+            summary.add_node(label, count=0, regret_sum=0.0)
+        summary.nodes[label]['count'] += 1
+        summary.nodes[label]['regret_sum'] += node_regret(data)
+    for label, data in summary.nodes(data=True):
+        data['mean_regret'] = data['regret_sum'] / data['count']
+    for src, dst in graph.edges:
+        a, b = groups[src], groups[dst]
+        if a != b:
+            weight = summary.edges[a, b]['weight'] + 1 if summary.has_edge(a, b) else 1
+            summary.add_edge(a, b, weight=weight)
+    return summary
+
+
+class GraphRenderer:
+    """Renders bounded-size graph views to PNG, reusing layouts between renders.
+
+    Layouts are cached per view. When the node set is unchanged the cached positions are reused as is;
+    otherwise they seed a short spring layout so existing nodes stay put and only new ones move.
+    """
+
+    def __init__(self, max_nodes: int = 500, layout_iterations: int = 50, cache_size: int = 8) -> None:
+        self.max_nodes = max_nodes
+        self.layout_iterations = layout_iterations
+        self.cache_size = cache_size
+        self._layouts: "OrderedDict[str, Dict[Hashable, Tuple[float, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def layout(self, key: str, graph: nx.DiGraph) -> Dict[Hashable, Any]:
+        with self._lock:
+            cached = self._layouts.get(key, {})
+        if cached and set(cached) == set(graph.nodes):
+            pos = cached
+        else:
+            seed = {n: cached[n] for n in graph.nodes if n in cached}
+            iterations = self.layout_iterations if len(seed) < len(graph) // 2 else max(5, self.layout_iterations // 5)
+            pos = nx.spring_layout(graph, pos=seed or None, iterations=iterations, seed=42)
+        with self._lock:
+            self._layouts[key] = pos
+            self._layouts.move_to_end(key)
+            while len(self._layouts) > self.cache_size:
+                self._layouts.popitem(last=False)
+        return pos
+
+    def render(self, graph: nx.DiGraph, view: str = 'nodes', time_bucket: str = 'day',
+               max_nodes: Optional[int] = None, out_path: Optional[str] = None,
+               cache_key: str = 'global') -> Dict[str, Any]:
+        """Render a view of `graph` and return its metadata plus the PNG bytes under 'image'."""
+        if view not in VIEWS:
+            raise ValueError(f"Unsupported view: {view}")
+        # Object-oriented matplotlib only: pyplot's global figure state is not safe across render threads
+        import matplotlib
+        matplotlib.use('Agg')  # networkx still imports pyplot; keep it off GUI backends
+        from matplotlib import colormaps
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        with time_stage('render'):
+            limit = max_nodes or self.max_nodes
+            shown = (sample_nodes(graph, limit) if view == 'nodes'
+                     else aggregate(graph, view, time_bucket, min(limit, MAX_GROUPS)))
+            pos = self.layout(f"{cache_key}:{view}:{time_bucket}", shown)
+            fig = Figure(figsize=(10, 8))
+            FigureCanvasAgg(fig)
+            ax = fig.add_subplot()
+            if view == 'nodes':
+                colors = ['red' if node_regret(d) > 7 else 'lightblue' for _, d in shown.nodes(data=True)]
+                labels = {n: d['prompt'][:20] + ('...' if len(d['prompt']) > 20 else '')
+                          for n, d in shown.nodes(data=True)} if len(shown) <= 100 else None
+                nx.draw(shown, pos, ax=ax, labels=labels, with_labels=labels is not None,
+                        node_color=colors, font_size=8, node_size=500 if len(shown) <= 100 else 40,
+                        arrows=len(shown) <= 100)
+                title = f"RegretGraph Knowledge Graph (Red: High Regret), {len(shown)} of {len(graph)} nodes"
+            else:
+                sizes = [300 + 2700 * d['count'] / len(graph) for _, d in shown.nodes(data=True)]
+                regrets = [d['mean_regret'] for _, d in shown.nodes(data=True)]
+                labels = {n: f"{n} ({d['count']})" for n, d in shown.nodes(data=True)}
+                widths = [1 + min(5, d['weight'] ** 0.5) for _, _, d in shown.edges(data=True)]
+                nx.draw(shown, pos, ax=ax, labels=labels, node_size=sizes, node_color=regrets,
+                        cmap=colormaps['coolwarm'], vmin=0, vmax=10, width=widths, font_size=8)
+                title = f"RegretGraph by {view} ({len(graph)} nodes, colour: mean regret)"
+            ax.set_title(title)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='png')
+        image = buffer.getvalue()
+        if out_path:
+            with open(out_path, 'wb') as f:
+                f.write(image)
+        return {'view': view, 'nodes': len(graph), 'rendered_nodes': len(shown), 'image': image}
+
+
+class RenderJob:
+    """One background render of a graph snapshot."""
+
+    def __init__(self, job_id: str, view: str, time_bucket: str, max_nodes: Optional[int]) -> None:
+        self.job_id = job_id
+        self.view = view
+        self.time_bucket = time_bucket
+        self.max_nodes = max_nodes
+        self.state = 'pending'
+        self.created_at = datetime.now().isoformat()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+    def run(self, renderer: GraphRenderer, snapshot: nx.DiGraph, cache_key: str) -> None:
+        self.state = 'running'
+        try:
+            self.result = renderer.render(snapshot, self.view, self.time_bucket, self.max_nodes, cache_key=cache_key)
+            self.state = 'done'
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+            logger.error(f"Render job {self.job_id} failed: {e}")
+
+    @property
+    def image(self) -> Optional[bytes]:
+        return self.result['image'] if self.result else None
+
+    def status(self) -> Dict[str, Any]:
+        status = {'job_id': self.job_id, 'state': self.state, 'view': self.view, 'created_at': self.created_at,
+                  'error': self.error}
+        if self.result:
+            status.update(nodes=self.result['nodes'], rendered_nodes=self.result['rendered_nodes'])
+        return status
+
+
+class RenderJobs:
+    """Bounded registry of recent render jobs; the oldest finished jobs and their images are dropped.
+
+    Jobs live in the process that created them. Ids are random, so with several API workers a job
+    looked up on the wrong worker is not found rather than confused with another worker's job.
+    """
+
+    def __init__(self, max_jobs: int = 16) -> None:
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, RenderJob]" = OrderedDict()
+
+    def create(self, view: str, time_bucket: str = 'day', max_nodes: Optional[int] = None) -> RenderJob:
+        if view not in VIEWS:
+            raise ValueError(f"Unsupported view: {view}")
+        if time_bucket not in TIME_BUCKETS:
+            raise ValueError(f"Unsupported time bucket: {time_bucket}")
+        job = RenderJob(uuid.uuid4().hex, view, time_bucket, max_nodes)
+        self._jobs[job.job_id] = job
+        for job_id in [j for j, old in self._jobs.items() if old.state in ('done', 'failed')]:
+            if len(self._jobs) <= self.max_jobs:
+                break
+            del self._jobs[job_id]
+        return job
+
+    def get(self, job_id: str) -> Optional[RenderJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [job.status() for job in reversed(self._jobs.values())]
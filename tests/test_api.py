@@ -32,19 +32,19 @@ def test_forget(client):
     assert 'removed_nodes' in resp.json()
 
 
-def test_prompt_endpoint(client, monkeypatch):
-    # Patch LLM and graph to avoid real LLM calls
+class DummyLLM:
+    async def call_model_async(self, prompt, max_tokens=100, context=""):
+        return "Test response"
 
-    class DummyLLM:
-        async def call_model_async(self, prompt, max_tokens=100, context=""):
-            return "Test response"
+    async def judge_response_async(self, prompt, response):
+        return ("good",
+                {'ethical_regret': 2, 'factual_accuracy': 8, 'emotional_impact': 7},
+                "Judgment: good, Ethical: 2, Factual: 8, Emotional: 7",
+                "This judgment reflects careful consideration of ethical implications.")
 
-        async def judge_response_async(self, prompt, response):
-            return ("good",
-                    {'ethical_regret': 2, 'factual_accuracy': 8, 'emotional_impact': 7},
-                    "Judgment: good, Ethical: 2, Factual: 8, Emotional: 7",
-                    "This judgment reflects careful consideration of ethical implications.")
 
+def test_prompt_endpoint(client, monkeypatch):
+    # Patch LLM and graph to avoid real LLM calls
     from api import api_server
     api_server.llm = DummyLLM()
     api_server.graph = api_server.KnowledgeGraph()
@@ -58,3 +58,197 @@ def test_prompt_endpoint(client, monkeypatch):
     assert 'emotion' in resp.json()
     assert 'mood' in resp.json()
     assert 'node_id' in resp.json()
+
+
+def test_prompt_batch_endpoint(client, monkeypatch):
+    import json
+    from api import api_server
+    monkeypatch.setattr(api_server, 'llm', DummyLLM())
+    monkeypatch.setattr(api_server, 'graph', api_server.KnowledgeGraph())
+    data = {"prompts": ["Hello", "Tell me a joke", "Goodbye"], "concurrency": 2}
+    resp = client.post('/v1/prompt/batch', json=data, headers={'Authorization': 'Basic YWRtaW46c2VjcmV0'})
+    assert resp.status_code == 200
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert len(lines) == 4
+    assert sorted(r['index'] for r in lines[:3]) == [0, 1, 2]
+    summary = lines[-1]['summary']
+    assert summary['succeeded'] == 3
+    # One bulk commit inserts every result in prompt order
+    assert len(api_server.graph.graph.nodes) == 3
+    assert api_server.graph.graph.nodes[1]['prompt'] == "Hello"
+    # Stamped with the judge that scored them, so a rejudge run can skip them
+    assert api_server.graph.graph.nodes[1]['judge_model'] == api_server.config.judge_model
+
+
+def test_prompt_batch_rejects_empty(client):
+    resp = client.post('/v1/prompt/batch', json={"prompts": []}, headers={'Authorization': 'Basic YWRtaW46c2VjcmV0'})
+    assert resp.status_code == 400
+
+
+def test_session_shards_are_isolated(client, monkeypatch, tmp_path):
+    import json
+    from api import api_server
+    from modules.shard_module import ShardManager
+    monkeypatch.setattr(api_server, 'llm', DummyLLM())
+    monkeypatch.setattr(api_server, 'graph', api_server.KnowledgeGraph())
+    monkeypatch.setattr(api_server, 'shards', ShardManager(str(tmp_path)))
+    auth = {'Authorization': 'Basic YWRtaW46c2VjcmV0'}
+    data = {"prompts": ["Hello", "Goodbye"], "session_id": "alice"}
+    resp = client.post('/v1/prompt/batch', json=data, headers=auth)
+    assert json.loads(resp.text.splitlines()[-1])['summary']['succeeded'] == 2
+    assert len(client.get('/v1/graph', params={'session_id': 'alice'}).json()['nodes']) == 2
+    assert len(client.get('/v1/graph', params={'session_id': 'bob'}).json()['nodes']) == 0
+    assert len(api_server.graph.graph) == 0
+    assert client.get('/v1/graph', params={'session_id': 'no/slashes'}).status_code == 400
+    # Low-regret results stay private to their session
+    assert len(api_server.shards.warnings.graph) == 0
+
+
+def test_batch_survives_shard_eviction(client, monkeypatch, tmp_path):
+    from api import api_server
+    from modules.shard_module import ShardManager
+
+    class EvictingLLM(DummyLLM):
+        async def call_model_async(self, prompt, max_tokens=100, context=""):
+            api_server.shards.get("bob")  # another session evicts alice mid-batch
+            return "Test response"
+
+    monkeypatch.setattr(api_server, 'llm', EvictingLLM())
+    monkeypatch.setattr(api_server, 'shards', ShardManager(str(tmp_path), max_shards=1))
+    data = {"prompts": ["Hello", "Goodbye"], "session_id": "alice"}
+    client.post('/v1/prompt/batch', json=data, headers={'Authorization': 'Basic YWRtaW46c2VjcmV0'})
+    assert len(api_server.shards.get("alice").graph) == 2
+
+
+def test_rejudge_job(monkeypatch, tmp_path):
+    import json
+    import time
+    from api import api_server
+    kg = api_server.KnowledgeGraph()
+    for i in range(5):
+        kg.add(f"Prompt {i}", "Old response", "bad",
+               {'ethical_regret': 9, 'factual_accuracy': 2, 'emotional_impact': 2}, "angry")
+    from modules.shard_module import ShardManager
+    shards = ShardManager(str(tmp_path / 'shards'))
+    alice = shards.get("alice")
+    for i in range(2):
+        alice.add(f"Alice {i}", "Old response", "bad",
+                  {'ethical_regret': 9, 'factual_accuracy': 2, 'emotional_impact': 2}, "angry")
+    shards.sync_warnings("alice", list(alice.graph.nodes))
+    monkeypatch.setattr(api_server, 'llm', DummyLLM())
+    monkeypatch.setattr(api_server, 'graph', kg)
+    monkeypatch.setattr(api_server, 'shards', shards)
+    monkeypatch.setitem(api_server.config.config, 'rejudge_checkpoint_path', str(tmp_path / 'graphs' / 'checkpoint.json'))
+    auth = {'Authorization': 'Basic YWRtaW46c2VjcmV0'}
+    with TestClient(api_server.app) as c:
+        resp = c.post('/v1/rejudge', json={"chunk_size": 2}, headers=auth)
+        assert resp.status_code == 200
+        for _ in range(50):
+            status = c.get('/v1/rejudge').json()
+            if status['state'] != 'running':
+                break
+            time.sleep(0.05)
+    assert status['state'] == 'completed'
+    assert status['processed'] == 7 and status['updated'] == 7
+    assert all(kg.graph.nodes[n]['judgment'] == 'good' for n in kg.graph.nodes)
+    # Session shards are re-judged too, and their no-longer-high-regret warnings are dropped
+    assert all(d['judgment'] == 'good' for _, d in shards.get("alice").graph.nodes(data=True))
+    assert len(shards.warnings.graph) == 0
+    assert kg.graph.nodes[1]['judge_model'] == api_server.config.judge_model
+    checkpoint = json.loads((tmp_path / 'graphs' / 'checkpoint.json').read_text())  # directory created on demand
+    assert checkpoint['cursors'] == {'global': 5, 'alice': 2}
+
+
+def test_render_job_returns_png(monkeypatch):
+    import time
+    from api import api_server
+    kg = api_server.KnowledgeGraph()
+    for i in range(12):
+        kg.add(f"Prompt {i}", "Response", "good",
+               {'ethical_regret': i % 10, 'factual_accuracy': 5, 'emotional_impact': 5}, "neutral")
+    monkeypatch.setattr(api_server, 'graph', kg)
+    auth = {'Authorization': 'Basic YWRtaW46c2VjcmV0'}
+    with TestClient(api_server.app) as c:
+        assert c.post('/v1/graph/render', json={"view": "bogus"}, headers=auth).status_code == 400
+        resp = c.post('/v1/graph/render', json={"view": "regret"}, headers=auth)
+        assert resp.status_code == 202
+        job_id = resp.json()['job_id']
+        assert c.get('/v1/graph/render/1').status_code == 404  # ids are random, never sequential
+        for _ in range(100):
+            status = c.get(f'/v1/graph/render/{job_id}').json()
+            if status['state'] in ('done', 'failed'):
+                break
+            time.sleep(0.05)
+        assert status['state'] == 'done' and status['rendered_nodes'] == 2  # low and medium bands
+        image = c.get(f'/v1/graph/render/{job_id}/image')
+    assert image.headers['content-type'] == 'image/png'
+    assert image.content.startswith(b'\x89PNG')
+
+
+def test_analytics_endpoint(client, monkeypatch):
+    from api import api_server
+    kg = api_server.KnowledgeGraph()
+    for i in range(4):
+        kg.add(f"Prompt {i}", "Response", "good" if i % 2 else "bad",
+               {'ethical_regret': 2, 'factual_accuracy': 8, 'emotional_impact': 8}, "happy")
+    monkeypatch.setattr(api_server, 'graph', kg)
+    resp = client.get('/v1/analytics', params={'granularity': 'day'})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body['totals']['count'] == 4 and body['totals']['avg_overall_regret'] == 2.0
+    assert body['buckets'][-1]['judgments'] == {'bad': 2, 'good': 2}
+    assert client.get('/v1/analytics', params={'granularity': 'week'}).status_code == 400
+    assert client.get('/v1/analytics', params={'start': 'yesterday'}).status_code == 400
+    # UTC 'Z' suffixes are accepted on every supported Python version
+    from datetime import datetime, timedelta, timezone
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    window = {'granularity': 'day', 'start': f"{(now - timedelta(days=1)).isoformat()}Z",
+              'end': f"{(now + timedelta(days=1)).isoformat()}Z"}
+    resp = client.get('/v1/analytics', params=window)
+    assert resp.status_code == 200 and resp.json()['totals']['count'] == 4
+
+
+def test_metrics_endpoint(client, monkeypatch):
+    from api import api_server
+    from modules.metrics_module import STAGE_LATENCY
+    monkeypatch.setattr(api_server, 'llm', DummyLLM())
+    monkeypatch.setattr(api_server, 'graph', api_server.KnowledgeGraph())
+    before = STAGE_LATENCY.count(stage='retrieval')
+    client.post('/v1/prompt', json={"prompt": "Hello"}, headers={'Authorization': 'Basic YWRtaW46c2VjcmV0'})
+    assert STAGE_LATENCY.count(stage='retrieval') == before + 1
+    resp = client.get('/metrics')
+    assert resp.status_code == 200
+    assert 'regretgraph_stage_seconds_bucket{stage="retrieval"' in resp.text
+    assert 'regretgraph_graph_nodes' in resp.text
+    assert 'regretgraph_http_request_seconds_count{method="POST",route="/v1/prompt",status="200"}' in resp.text
+
+
+def test_profiling_admin_endpoints(client, monkeypatch, tmp_path):
+    import pstats
+    from api import api_server
+    from modules.profiling_module import RequestProfiler
+    monkeypatch.setattr(api_server, 'profiler', RequestProfiler(enabled=True, slow_threshold_ms=10000))
+    auth = {'Authorization': 'Basic YWRtaW46c2VjcmV0'}
+    # Fast, unrequested requests are not retained
+    client.get('/v1/graph')
+    assert client.get('/v1/admin/profiles', headers=auth).json()['profiles'] == []
+    # Forced profiling is only honoured for admins
+    assert 'X-Profile-Id' not in client.get('/v1/graph', headers={'X-Profile': '1'}).headers
+    resp = client.get('/v1/graph', headers={'X-Profile': '1', **auth})
+    trace_id = int(resp.headers['X-Profile-Id'])
+    profiles = client.get('/v1/admin/profiles', headers=auth).json()['profiles']
+    assert profiles[0]['id'] == trace_id and profiles[0]['path'] == '/v1/graph'
+    assert 'function calls' in client.get(f'/v1/admin/profiles/{trace_id}', headers=auth).text
+    raw = client.get(f'/v1/admin/profiles/{trace_id}?format=pstats', headers=auth)
+    (tmp_path / 'trace.prof').write_bytes(raw.content)
+    assert pstats.Stats(str(tmp_path / 'trace.prof')).total_calls > 0
+    assert client.get('/v1/admin/profiles').status_code == 401
+
+
+def test_import_is_lazy():
+    import subprocess
+    import sys
+    code = ("import sys, api.api_server as s; "
+            "heavy = [m for m in ('matplotlib', 'transformers', 'torch', 'sklearn', 'boto3') if m in sys.modules]; "
+            "assert not heavy, heavy; assert s.llm is None")
+    subprocess.run([sys.executable, '-c', code], check=True)
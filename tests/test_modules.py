@@ -0,0 +1,420 @@
+import pytest
+from datetime import datetime, timedelta
+from modules.graph_module import KnowledgeGraph
+from modules.config_module import Config
+
+
+def test_context_builder_budget_and_warnings(sample_graph):
+    from modules.context_module import ContextBuilder
+    builder = ContextBuilder(token_budget=60, snippet_chars=60)
+    relevant = sample_graph.retrieve_relevant("Insult me with a joke", top_k=3)
+    context = builder.build(relevant)
+    assert len(context) <= builder.char_budget
+    # The high-regret node is surfaced first as a warning
+    assert context.splitlines()[1].startswith("Warning (high regret) past prompt: Insult me")
+    # Condensed snippets are cached per node
+    assert len(builder._snippets) == len(relevant)
+    builder.build(relevant)
+    assert len(builder._snippets) == len(relevant)
+
+
+def test_context_builder_condense():
+    from modules.context_module import ContextBuilder
+    text = "First sentence here. Second sentence is considerably longer and will be cut."
+    condensed = ContextBuilder.condense(text, 40)
+    assert len(condensed) <= 40
+    assert condensed == "First sentence here..."
+    assert ContextBuilder.condense("short", 40) == "short"
+
+
+def test_add_many_bulk_commit(sample_graph):
+    records = [{'prompt': f"Bulk {i}", 'response': "ok", 'judgment': "good",
+                'regret_scores': {'ethical_regret': 1, 'factual_accuracy': 9, 'emotional_impact': 9},
+                'emotion': "happy"} for i in range(3)]
+    node_ids = sample_graph.add_many(records)
+    assert node_ids == [4, 5, 6]
+    assert (3, 4) in sample_graph.graph.edges and (5, 6) in sample_graph.graph.edges
+    # Ids stay unique after pruning
+    sample_graph.graph.remove_node(2)
+    assert sample_graph.add("New", "resp", "good", records[0]['regret_scores'], "happy") == 7
+    sample_graph.add_many(records[:1], judge_model="judge-v2")
+    assert sample_graph.graph.nodes[8]['judge_model'] == "judge-v2"
+
+
+def test_metrics_histogram_render():
+    from modules.metrics_module import Histogram, Counter
+    hist = Histogram('test_seconds', 'Test latency.', ['stage'], buckets=(0.1, 1.0))
+    hist.observe(0.05, stage='a')
+    hist.observe(0.5, stage='a')
+    hist.observe(5, stage='a')
+    text = hist.render()
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{stage="a",le="1.0"} 2' in text
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 'test_seconds_count{stage="a"} 3' in text
+    counter = Counter('test_errors_total', 'Test errors.', ['provider'])
+    counter.inc(provider='x')
+    counter.inc(provider='x')
+    assert counter.value(provider='x') == 2
+
+
+class ScriptedProvider:
+    """Provider with a fixed delay that can be told to fail."""
+    def __init__(self, name, delay=0.0, fail=False):
+        self.model_name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def call_model(self, prompt, max_tokens=100):
+        import time
+        self.calls += 1
+        time.sleep(self.delay)
+        return "Error: down" if self.fail else f"answer from {self.model_name}"
+
+
+def test_routing_provider_hedges_slow_primary():
+    from modules.llm_module import RoutingProvider
+    slow, fast = ScriptedProvider("slow", delay=0.5), ScriptedProvider("fast")
+    router = RoutingProvider([slow, fast], initial_hedge_delay=0.05)
+    assert router.call_model("hi") == "answer from fast"
+    assert slow.calls == 1 and fast.calls == 1
+
+
+def test_routing_provider_rearms_hedge_after_failover():
+    from modules.llm_module import RoutingProvider
+    failing = ScriptedProvider("failing", delay=0.3, fail=True)
+    second, third = ScriptedProvider("second", delay=0.3), ScriptedProvider("third")
+    router = RoutingProvider([failing, second, third], initial_hedge_delay=0.4)
+    # The failover to `second` gets its own hedge delay instead of the primary's leftover 0.1s
+    assert router.call_model("hi") == "answer from second"
+    assert third.calls == 0
+
+
+def test_routing_provider_circuit_breaker_and_failover():
+    from modules.llm_module import RoutingProvider
+    broken, backup = ScriptedProvider("broken", fail=True), ScriptedProvider("backup")
+    router = RoutingProvider([broken, backup], failure_threshold=2, cooldown_seconds=60)
+    for _ in range(2):
+        assert router.call_model("hi") == "answer from backup"
+    # Breaker is open: the broken provider is no longer tried
+    router.call_model("hi")
+    assert broken.calls == 2
+    assert router.snapshot()["ScriptedProvider:broken"]["circuit_open"] is True
+
+
+def test_routing_provider_half_open_admits_one_trial():
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from modules.llm_module import RoutingProvider
+    flaky, backup = ScriptedProvider("flaky", fail=True), ScriptedProvider("backup", delay=0.05)
+    router = RoutingProvider([flaky, backup], failure_threshold=1, cooldown_seconds=0.1)
+    assert router.call_model("hi") == "answer from backup"
+    time.sleep(0.15)
+    flaky.fail, flaky.delay = False, 0.3
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        answers = list(pool.map(router.call_model, ["hi"] * 4))
+    # Only one concurrent caller probes the recovering provider; the rest stay on the backup
+    assert flaky.calls == 2
+    assert answers.count("answer from flaky") == 1 and answers.count("answer from backup") == 3
+    assert router.snapshot()["ScriptedProvider:flaky"]["circuit_open"] is False
+
+
+def test_routing_provider_judge_fallback_under_pressure():
+    from modules.llm_module import RoutingProvider
+    judge, cheap = ScriptedProvider("judge", delay=0.05), ScriptedProvider("cheap")
+    router = RoutingProvider([judge], fallbacks=[cheap], pressure_latency_seconds=0.01)
+    assert router.call_model("hi") == "answer from judge"
+    # The judge's latency EWMA is now above the pressure threshold
+    assert router.call_model("hi") == "answer from cheap"
+
+
+def test_config_builds_routing_providers(tmp_path):
+    from modules.llm_module import RoutingProvider, OpenAIProvider
+    path = tmp_path / "config.yaml"
+    path.write_text("llm_provider: openai\nmodel: gpt-4\nopenai_api_key: test\n"
+                    "fallback_providers:\n  - provider: ollama\n    model: llama2\n"
+                    "judge_fallback_model: gpt-3.5-turbo\n")
+    config = Config(str(path))
+    assert isinstance(config.create_llm_provider(), RoutingProvider)
+    judge = config.create_judge_provider()
+    assert isinstance(judge, RoutingProvider)
+    assert isinstance(judge.fallbacks[0], OpenAIProvider) and judge.fallbacks[0].model_name == "gpt-3.5-turbo"
+
+    path.write_text("llm_provider: ollama\nfallback_providers:\n  - model: llama2\n")
+    with pytest.raises(ValueError, match=r"fallback_providers\[0\] needs a 'provider'"):
+        Config(str(path)).create_llm_provider()
+
+
+def test_shared_graph_store_across_workers(tmp_path):
+    from modules.store_module import SharedKnowledgeGraph
+    path = str(tmp_path / "graph.db")
+    worker_a = SharedKnowledgeGraph(path, refresh_interval=0)
+    worker_b = SharedKnowledgeGraph(path, refresh_interval=0)
+    scores = {'ethical_regret': 2, 'factual_accuracy': 8, 'emotional_impact': 7}
+    first = worker_a.add("Hello world", "Hi", "good", scores, "neutral")
+    second = worker_b.add("Tell me a joke", "No", "bad", scores, "sad")
+    assert first != second
+    assert set(worker_a.graph.nodes) == set(worker_b.graph.nodes) == {first, second}
+    assert worker_a.graph.has_edge(first, second)
+
+    worker_a.update_node(second, judgment="neutral")
+    assert worker_b.graph.nodes[second]['judgment'] == "neutral"
+    worker_b.remove_nodes([first])
+    assert list(worker_a.graph.nodes) == [second]
+    assert worker_a.add_many([{'prompt': "p", 'response': "r", 'judgment': "good",
+                               'regret_scores': scores, 'emotion': "happy"}]) == [second + 1]
+
+    reopened = SharedKnowledgeGraph(path)
+    assert set(reopened.graph.nodes) == {second, second + 1}
+    now = datetime.now()
+    for kg in (worker_a, reopened):
+        assert kg.rollups.query('hour', now - timedelta(hours=1), now)['totals']['judgments'] == {'neutral': 1, 'good': 1}
+    for kg in (worker_a, worker_b, reopened):
+        kg.close()
+
+
+def test_shared_graph_store_write_backs_off_while_locked(tmp_path):
+    import sqlite3
+    import threading
+    import time
+    from modules.store_module import SharedKnowledgeGraph
+    path = str(tmp_path / "graph.db")
+    store = SharedKnowledgeGraph(path, busy_timeout=0.02, write_timeout=0.2)
+    scores = {'ethical_regret': 2, 'factual_accuracy': 8, 'emotional_impact': 7}
+    other_worker = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    other_worker.execute("BEGIN IMMEDIATE")
+    start = time.monotonic()
+    with pytest.raises(sqlite3.OperationalError):
+        store.add("Hello", "Hi", "good", scores, "neutral")
+    assert time.monotonic() - start < 1  # bounded by write_timeout, not a 30s busy wait
+    # Once the other writer commits, a retry picks the lock up
+    store.write_timeout = 5.0
+    threading.Timer(0.1, lambda: other_worker.execute("COMMIT")).start()
+    assert store.add("Hello", "Hi", "good", scores, "neutral") == 1
+    other_worker.close()
+    store.close()
+
+
+def test_shard_manager_lru_persistence_and_warnings(tmp_path):
+    from modules.shard_module import ShardManager
+    shards = ShardManager(str(tmp_path), max_shards=1)
+    alice = shards.get("alice")
+    node = alice.add("Insult my coworker", "You're stupid", "bad",
+                     {'ethical_regret': 9, 'factual_accuracy': 2, 'emotional_impact': 1}, "angry")
+    shards.sync_warnings("alice", [node])
+
+    bob = shards.get("bob")
+    assert shards.loaded() == ["bob"] and (tmp_path / "alice.pkl").exists()
+    assert len(bob.graph) == 0
+    relevant = shards.retrieve_relevant("bob", "Should I insult my coworker?")
+    assert [r['prompt'] for r in relevant] == ["Insult my coworker"]
+    assert shards.retrieve_relevant("alice", "Should I insult my coworker?")[0]['node_id'] == node
+    assert len(shards.get("alice").graph) == 1
+    with pytest.raises(ValueError):
+        shards.get("../etc")
+
+    # The warnings mirror was saved with alice's eviction, before any shutdown
+    assert len(ShardManager(str(tmp_path)).warnings.graph) == 1
+    shards.idle_seconds = 0
+    shards.evict_idle()
+    assert shards.loaded() == [] and (tmp_path / "bob.pkl").exists()
+
+
+def test_context_snippets_do_not_leak_across_shards(tmp_path):
+    from modules.context_module import ContextBuilder
+    from modules.shard_module import ShardManager
+    shards = ShardManager(str(tmp_path))
+    builder = ContextBuilder()
+    ids = shards.get("alice").add_many([
+        {'prompt': "my private bank password is hunter2", 'response': "Noted", 'judgment': "good",
+         'regret_scores': {'ethical_regret': 1, 'factual_accuracy': 9, 'emotional_impact': 9}, 'emotion': "happy"},
+        {'prompt': "Insult my coworker", 'response': "You're stupid", 'judgment': "bad",
+         'regret_scores': {'ethical_regret': 9, 'factual_accuracy': 2, 'emotional_impact': 1}, 'emotion': "angry"}])
+    shards.sync_warnings("alice", ids)
+    builder.build(shards.retrieve_relevant("alice", "bank password"))
+    context = builder.build(shards.retrieve_relevant("bob", "Should I insult my coworker?"))
+    assert "Insult my coworker" in context and "hunter2" not in context
+
+
+def test_graph_renderer_samples_aggregates_and_closes_figures(sample_graph, tmp_path):
+    import matplotlib.pyplot as plt
+    from modules.visualization_module import GraphRenderer, aggregate, sample_nodes
+    assert set(sample_nodes(sample_graph.graph, 2).nodes) == {3, 1}  # highest regret, then most recent
+    bands = aggregate(sample_graph.graph, 'regret')
+    assert {n: d['count'] for n, d in bands.nodes(data=True)} == {'low regret': 2, 'high regret': 1}
+    assert bands.edges['low regret', 'high regret']['weight'] == 1
+
+    renderer = GraphRenderer(max_nodes=2)
+    result = renderer.render(sample_graph.graph, 'nodes', out_path=str(tmp_path / "graph.png"))
+    assert result['rendered_nodes'] == 2 and (tmp_path / "graph.png").read_bytes() == result['image']
+    renderer.render(sample_graph.graph, 'cluster')
+    assert plt.get_fignums() == []
+    assert len(renderer._layouts) == 2
+
+
+def test_graph_renderer_concurrent_renders_are_isolated(sample_graph):
+    from concurrent.futures import ThreadPoolExecutor
+    from modules.visualization_module import GraphRenderer
+    big = KnowledgeGraph()
+    big.add_many([{'prompt': f"Prompt {i}", 'response': "r", 'judgment': "good", 'emotion': "happy",
+                   'regret_scores': {'ethical_regret': i % 10, 'factual_accuracy': 5, 'emotional_impact': 5}}
+                  for i in range(60)])
+    jobs = [(sample_graph.graph, 'nodes'), (big.graph, 'regret')] * 4
+    expected = [GraphRenderer().render(g, view)['image'] for g, view in jobs[:2]]
+    renderer = GraphRenderer()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        images = list(pool.map(lambda job: renderer.render(*job)['image'], jobs))
+    assert images == expected * 4
+
+
+def test_judgment_engine_json_verdict_skips_reflection_call():
+    from modules.llm_module import LLMJudger
+    from modules.metrics_module import JUDGE_PARSES
+
+    class JSONJudge:
+        def __init__(self):
+            self.prompts = []
+
+        def call_model(self, prompt, max_tokens=100):
+            self.prompts.append(prompt)
+            return ('Sure! {"judgment": "Bad", "ethical": 12, "factual": "3", "emotional": 2, '
+                    '"reflection": "I was careless."}')
+
+    judge = JSONJudge()
+    before = JUDGE_PARSES.value(method='json')
+    judgment, scores, _, hot_thought = LLMJudger(judge).judge_response("Insult me", "You're stupid")
+    assert (judgment, hot_thought) == ("bad", "I was careless.")
+    assert scores == {'ethical_regret': 10, 'factual_accuracy': 3, 'emotional_impact': 2}
+    assert len(judge.prompts) == 1 and "'Insult me': 'You're stupid'" in judge.prompts[0]
+    assert JUDGE_PARSES.value(method='json') == before + 1
+
+
+def test_judgment_engine_regex_fallback_and_errors():
+    from modules.judgment_module import JudgmentEngine
+    from modules.llm_module import LLMJudger
+    from modules.metrics_module import JUDGE_FALLBACKS
+    engine = JudgmentEngine()
+    verdict = engine.parse("Judgment - BAD. Ethical regret: 8, factual accuracy is 3, Emotional: 2")
+    assert verdict.method == 'regex' and verdict.judgment == 'bad' and verdict.reflection is None
+    assert verdict.scores == {'ethical_regret': 8, 'factual_accuracy': 3, 'emotional_impact': 2}
+    before = JUDGE_FALLBACKS.value()
+    assert engine.parse("no verdict here").method == 'failed'
+    assert JUDGE_FALLBACKS.value() == before + 1
+    # Overflowing or non-finite JSON scores fall back to the regex parser instead of crashing the judging task
+    for bad in ('1e400', 'NaN', 'Infinity'):
+        verdict = engine.parse(f'{{"judgment": "good", "ethical": {bad}, "factual": 5, "emotional": 5}}')
+        assert verdict.method == 'regex' and verdict.scores['ethical_regret'] == 5
+
+    class FailingJudge:
+        def call_model(self, prompt, max_tokens=100):
+            return "Error: connection refused"
+    judgment, scores, text, hot_thought = LLMJudger(FailingJudge()).judge_response("p", "r")
+    assert judgment == 'neutral' and text.startswith("Error:") and hot_thought == ""
+
+
+def test_regret_rollups_track_add_update_and_prune(sample_graph):
+    now = datetime.now()
+    window = sample_graph.rollups.query('day', now - timedelta(days=10), now)
+    assert window['totals']['count'] == 3
+    assert [b['count'] for b in window['buckets']] == [1, 1, 1]
+    assert window['totals']['judgments'] == {'good': 2, 'bad': 1}
+
+    today = sample_graph.rollups.query('hour', now - timedelta(hours=1), now)['totals']
+    assert today['count'] == 1 and today['avg_scores']['ethical_regret'] == 3
+    sample_graph.update_node(1, regret_scores={'ethical_regret': 9, 'factual_accuracy': 7, 'emotional_impact': 6},
+                             emotion="sad")
+    today = sample_graph.rollups.query('hour', now - timedelta(hours=1), now)['totals']
+    assert today['avg_scores']['ethical_regret'] == 9 and today['emotions'] == {'sad': 1}
+
+    sample_graph.remove_nodes([3])
+    assert sample_graph.rollups.query('day', now - timedelta(days=10), now)['totals']['count'] == 2
+    # Loading (replacing the graph) rebuilds the rollups
+    reloaded = KnowledgeGraph()
+    reloaded.graph = sample_graph.graph
+    assert reloaded.rollups.query('minute', now - timedelta(minutes=5), now)['totals']['count'] == 1
+    with pytest.raises(ValueError):
+        reloaded.rollups.query('minute', now - timedelta(days=30), now)
+
+
+def test_regret_rollups_feedback_on_pruned_bucket():
+    kg = KnowledgeGraph()
+    old = (datetime.now() - timedelta(days=5)).isoformat()
+    kg.add_many([{'prompt': f"p{i}", 'response': "r", 'judgment': "good", 'emotion': "happy", 'timestamp': old,
+                  'regret_scores': {'ethical_regret': 2, 'factual_accuracy': 8, 'emotional_impact': 8}}
+                 for i in range(3)])
+    kg.graph = kg.graph  # reloading rebuilds the rollups and prunes expired buckets
+    start, end = datetime.fromisoformat(old) - timedelta(minutes=1), datetime.fromisoformat(old) + timedelta(minutes=1)
+    assert kg.rollups.query('minute', start, end)['buckets'] == []  # past the 2-day minute retention
+    kg.update_node(1, judgment="bad")
+    assert kg.rollups.query('minute', start, end)['buckets'] == []
+    hour = kg.rollups.query('hour', start, end)['totals']
+    assert hour['count'] == 3 and hour['judgments'] == {'good': 2, 'bad': 1}
+
+
+def test_sentiment_model_load_retries_after_backoff(monkeypatch):
+    import sys
+    import types
+    from modules import emotion_module
+    attempts = []
+
+    def pipeline(task, model):
+        attempts.append(model)
+        if len(attempts) == 1:
+            raise OSError("download failed")
+        return lambda text: [{'label': 'LABEL_2'}]
+
+    now = [1000.0]
+    monkeypatch.setitem(sys.modules, 'transformers', types.SimpleNamespace(pipeline=pipeline))
+    monkeypatch.setattr(emotion_module.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(emotion_module, 'sentiment_analyzer', None)
+    monkeypatch.setattr(emotion_module, '_load_error', None)
+    with pytest.raises(OSError):
+        emotion_module.get_sentiment_analyzer()
+    # Within the backoff the cached error is raised without another download attempt
+    with pytest.raises(RuntimeError):
+        emotion_module.get_sentiment_analyzer()
+    assert len(attempts) == 1
+    now[0] += emotion_module.LOAD_RETRY_SECONDS
+    assert emotion_module.get_sentiment_analyzer()("great")[0]['label'] == 'LABEL_2'
+    assert len(attempts) == 2 and emotion_module._load_error is None
+
+
+def test_benchmark_compare_uses_relative_times():
+    from benchmarks.run_benchmarks import compare, normalize
+    baseline = {'retrieval': {'median_ms': 10.0}, 'add': {'median_ms': 1.0}}
+    normalize(baseline, calibration_ms=5.0)
+    assert baseline['retrieval']['relative'] == 2.0
+    # A host twice as slow across the board is not a regression
+    slower_host = {'retrieval': {'median_ms': 20.0}, 'add': {'median_ms': 2.0}}
+    normalize(slower_host, calibration_ms=10.0)
+    assert compare(slower_host, baseline, tolerance=0.5) == []
+    # ...but one benchmark slowing down relative to the calibration is
+    slower_host['retrieval'] = {'median_ms': 40.0}
+    normalize(slower_host, calibration_ms=10.0)
+    regressions = compare(slower_host, baseline, tolerance=0.5)
+    assert len(regressions) == 1 and regressions[0].startswith('retrieval:') and '2.00x relative' in regressions[0]
+    # Baselines without relative numbers fall back to absolute medians
+    assert compare({'add': {'median_ms': 2.0}}, {'add': {'median_ms': 1.0}}, tolerance=0.5) == [
+        "add: 2.0ms vs baseline 1.0ms (2.00x absolute)"]
+
+
+def test_benchmark_harness_baseline_round_trip(monkeypatch, tmp_path):
+    import json
+    from benchmarks import run_benchmarks
+    from modules import emotion_module
+    monkeypatch.setattr(emotion_module, 'sentiment_analyzer', None)  # restored after the stub is installed
+    baseline = tmp_path / 'baseline.json'
+    args = ['--sizes', '10', '--repeat', '1', '--skip-api', '--import-repeat', '0', '--baseline', str(baseline)]
+    assert run_benchmarks.main(args + ['--update-baseline']) == 0
+    report = json.loads(baseline.read_text())
+    assert report['meta']['calibration_ms'] > 0 and 'cpu_count' in report['meta']
+    assert set(report['results']) == {'retrieval[n=10]', 'add[n=10]', 'forgetting[n=10]', 'clustering[n=10]'}
+    assert all(r['relative'] > 0 for r in report['results'].values())
+    # A generous tolerance keeps the re-run stable on a noisy machine
+    assert run_benchmarks.main(args + ['--tolerance', '100']) == 0
+    # A baseline that is far faster than anything achievable is reported as a regression
+    for r in report['results'].values():
+        r['relative'] = r['relative'] / 1000
+    baseline.write_text(json.dumps(report))
+    assert run_benchmarks.main(args) == 1
@@ -5,21 +5,6 @@ from modules.graph_module import KnowledgeGraph
 from modules.config_module import Config
 
 
-# Mock KnowledgeGraph for testing
-@pytest.fixture
-def sample_graph():
-    kg = KnowledgeGraph()
-    kg.add("Hello world", "Hi there", "good",
-           {'ethical_regret': 3, 'factual_accuracy': 7, 'emotional_impact': 6}, "neutral",
-           timestamp=datetime.now().isoformat())
-    kg.add("Tell me a joke", "Why did the chicken cross the road?", "good",
-           {'ethical_regret': 2, 'factual_accuracy': 9, 'emotional_impact': 8}, "happy",
-           timestamp=(datetime.now() - timedelta(days=2)).isoformat())
-    kg.add("Insult me", "You're stupid", "bad", {'ethical_regret': 9, 'factual_accuracy': 4, 'emotional_impact': 2}, "angry",
-           timestamp=(datetime.now() - timedelta(days=10)).isoformat())
-    return kg
-
-
 def test_judge_response():
     # Mock LLM provider
     class DummyProvider: